@@ -0,0 +1,119 @@
+"""Answer a file of questions with the chatbot's retrieval and prompt stack, without the UI.
+
+Each question is asked on its own (no history), like the first question of a chat, through
+the same chain as main.py. Answers, sources, token counts and timings are written to a JSONL
+file, one line per question in the order they finish. With --warm-cache the answers are
+also stored in the answer cache file that main.py loads at startup.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import main
+from utils import metrics
+from utils.answer_cache import ANSWER_CACHE_FILE
+from utils.streaming import MessageStreamHandler
+
+class DiscardedMessage:
+    """The streamed tokens are only counted and timed, the answer comes from the chain result."""
+
+    async def stream_token(self, token):
+        pass
+
+def load_questions(path):
+    """One question per line, or JSONL records with a "question" field."""
+    questions = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            questions.append(json.loads(line)['question'] if line.startswith('{') else line)
+    return questions
+
+async def answer_question(position, question, semaphore, warm_cache):
+    async with semaphore:
+        start = time.perf_counter()
+        record = {'index': position, 'question': question}
+        try:
+            # A fresh retriever per question, so no boss is carried over from another one
+            chain = main.qa_bot()
+            handler = MessageStreamHandler(DiscardedMessage(), start)
+            res = await chain.acall({"question": question, "chat_history": []}, callbacks=[handler])
+            documents = res.get("source_documents", [])
+            record.update(
+                answer=res.get("answer", ""),
+                sources=[{key: doc.metadata.get(key) for key in ('boss', 'section', 'source')} for doc in documents],
+                token_counts=res.get('token_counts'),
+                time_to_first_token_seconds=handler.first_token_seconds,
+                generation_seconds=handler.generation_seconds,
+            )
+            if warm_cache:
+                main.answer_cache.store(question, main.embed_question(question), record['answer'],
+                                        [doc.metadata.get('source') for doc in documents])
+        except Exception as e:
+            metrics.incr('errors{stage="batch"}')
+            record['error'] = str(e)
+        record['seconds'] = time.perf_counter() - start
+        metrics.observe('batch_question_seconds', record['seconds'])
+        return record
+
+async def run_batch(questions, output, parallel, warm_cache):
+    # The batch sets its own concurrency against Ollama, the chat queue (LLM_MAX_CONCURRENT) isn't used
+    semaphore = asyncio.Semaphore(parallel)
+    tasks = [asyncio.create_task(answer_question(position, question, semaphore, warm_cache))
+             for position, question in enumerate(questions)]
+    errors = 0
+    with open(output, 'w', encoding='utf-8') as file:
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            record = await task
+            errors += 'error' in record
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            file.flush()
+            status = f"error: {record['error']}" if 'error' in record else f"{record['seconds']:.2f}s"
+            print(f"[{done}/{len(questions)}] {record['question'][:60]} ({status})")
+    return errors
+
+def batch_qa(questions_path, output, parallel=2, warm_cache=False, cache_file=ANSWER_CACHE_FILE):
+    questions = load_questions(questions_path)
+    if not questions:
+        raise RuntimeError(f"No questions found in {questions_path}")
+
+    start = time.perf_counter()
+    resources = main.get_shared_resources()
+    resources['embeddings'].load()
+    print(f"Loaded in {time.perf_counter() - start:.2f}s, answering {len(questions)} questions, {parallel} at a time")
+
+    if warm_cache:
+        # Add to the answers already saved for this index, if any
+        if os.path.exists(cache_file):
+            main.answer_cache.load(cache_file)
+        main.answer_cache.check_version(resources['index_version'])
+
+    start = time.perf_counter()
+    errors = asyncio.run(run_batch(questions, output, parallel, warm_cache))
+    elapsed = time.perf_counter() - start
+
+    summary = metrics.snapshot()['timings'].get('batch_question_seconds', {})
+    print(f"\n{len(questions)} questions in {elapsed:.2f}s ({len(questions) / elapsed:.2f} questions/s), {errors} errors")
+    if summary:
+        print(f"Per question: p50 {summary['p50']:.2f}s, p95 {summary['p95']:.2f}s, max {summary['max']:.2f}s")
+    print(f"Answers written to {output}")
+    if warm_cache:
+        main.answer_cache.save(cache_file)
+        print(f"Answer cache: {len(main.answer_cache)} entries saved to {cache_file}")
+    return errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of questions without the chat UI.")
+    parser.add_argument('questions', help="Text file with one question per line, or JSONL with a \"question\" field")
+    parser.add_argument('--output', default="answers.jsonl", help="JSONL file for answers, sources and timings")
+    parser.add_argument('--parallel', type=int, default=2, help="Questions answered at the same time")
+    parser.add_argument('--warm-cache', action='store_true', help="Save the answers in the answer cache main.py loads at startup")
+    parser.add_argument('--cache-file', default=ANSWER_CACHE_FILE, help="Answer cache file used with --warm-cache")
+    args = parser.parse_args()
+
+    batch_qa(args.questions, args.output, parallel=max(1, args.parallel), warm_cache=args.warm_cache,
+             cache_file=args.cache_file)
@@ -0,0 +1,92 @@
+"""Compare FAISS index types on our corpus: build time, size, query latency and recall@k vs exact search."""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import ingest
+from utils.metrics import percentile
+
+def corpus_vectors(data_path, embeddings, scale):
+    """Embed the chunks of the corpus; with scale > corpus size, add jittered copies to simulate a bigger wiki."""
+    texts = ingest.split_documents(ingest.load_documents(data_path))
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in texts]), dtype=np.float32)
+    if scale and scale > len(vectors):
+        rng = np.random.default_rng(0)
+        picks = vectors[rng.integers(0, len(vectors), scale - len(vectors))]
+        noise = rng.normal(0, 0.05, picks.shape).astype(np.float32)
+        vectors = np.vstack([vectors, picks + noise])
+    return vectors
+
+def bench_index(index_type, params, vectors, queries, exact_ids, k):
+    import faiss
+
+    start = time.perf_counter()
+    index = ingest.create_faiss_index(vectors, index_type, **params)
+    index.add(vectors)
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    hits = 0
+    for query, exact in zip(queries, exact_ids):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(ids[0]) & set(exact))
+
+    return {
+        'index': index_type,
+        'build_s': round(build_s, 4),
+        'size_bytes': int(faiss.serialize_index(index).size),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+        f'recall@{k}': round(hits / (len(queries) * k), 4),
+    }
+
+def run(data_path, index_types, params, k, n_queries, scale, fake_embeddings):
+    import faiss
+
+    if fake_embeddings:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=384)
+    else:
+        embeddings = ingest.create_embeddings()
+
+    vectors = corpus_vectors(data_path, embeddings, scale)
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(1)
+    # Queries: corpus vectors with some noise, the usual setup for ANN recall measurements
+    queries = vectors[rng.integers(0, len(vectors), n_queries)]
+    queries = queries + rng.normal(0, 0.05, queries.shape).astype(np.float32)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, exact_ids = exact.search(queries, k)
+
+    print(f"{len(vectors)} vectors, {n_queries} queries, k={k}")
+    results = [bench_index(index_type, params, vectors, queries, exact_ids, k) for index_type in index_types]
+    header = list(results[0])
+    print('  '.join(f"{name:>12}" for name in header))
+    for result in results:
+        print('  '.join(f"{str(result[name]):>12}" for name in header))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types against exact search.")
+    parser.add_argument('--data', default=ingest.DATA_PATH, help="Folder with the scraped documents")
+    parser.add_argument('--types', default=','.join(ingest.INDEX_TYPES), help="Comma separated index types")
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--scale', type=int, default=0, help="Grow the corpus to this many vectors with jittered copies")
+    parser.add_argument('--fake-embeddings', action='store_true', help="Use deterministic fake embeddings (no model download)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    ingest.add_index_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args.data, args.types.split(','), ingest.index_params_from_args(args), args.k,
+                  args.queries, args.scale, args.fake_embeddings)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
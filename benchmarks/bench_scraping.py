@@ -0,0 +1,42 @@
+"""Measure scraping throughput against the local fake wiki for several worker counts."""
+import argparse
+import tempfile
+
+import utils.http_fetch as http_fetch
+from benchmarks.fake_wiki import start_server
+from web_scraping import web_scraping
+
+def run(pages, worker_counts, latency, rate, failures):
+    server, base_url = start_server(latency=latency)
+    urls = [f"{base_url}Boss_{i}" for i in range(pages)]
+    urls += [f"{base_url}Missing_{i}" for i in range(failures)]
+    http_fetch.set_host_rate(rate, burst=max(worker_counts))
+
+    results = {}
+    try:
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                # Fresh cache for every run so each one really downloads the pages
+                http_fetch.CACHE_DIR = f"{tmp}/cache"
+                for key in http_fetch.fetch_stats:
+                    http_fetch.fetch_stats[key] = 0
+                print(f"\n=== {workers} worker(s) ===")
+                results[workers] = web_scraping(urls, workers=workers, output_root=f"{tmp}/data")
+    finally:
+        server.shutdown()
+
+    print("\nworkers  pages/s  elapsed_s  failed")
+    for workers, summary in results.items():
+        print(f"{workers:>7}  {summary['pages_per_s']:>7}  {summary['elapsed_s']:>9}  {len(summary['failed']):>6}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scraping throughput benchmark (offline).")
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--workers', default="1,4,8", help="Comma separated worker counts to compare")
+    parser.add_argument('--latency', type=float, default=0.2, help="Simulated server latency per page in seconds")
+    parser.add_argument('--rate', type=float, default=0, help="Per-host request rate limit (0 = unlimited)")
+    parser.add_argument('--failures', type=int, default=1, help="Number of pages that answer 404")
+    args = parser.parse_args()
+
+    run(args.pages, [int(w) for w in args.workers.split(',')], args.latency, args.rate, args.failures)
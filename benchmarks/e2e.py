@@ -0,0 +1,205 @@
+"""End-to-end latency benchmark, fully offline: scrape the fixture wiki, run ingest.py, then
+answer a fixed question set through main.py's message handler (stats table, answer cache,
+admission queue, chain) with a fake Ollama server as the LLM. The sessions of a round run
+concurrently, so questions also wait in the admission queue.
+
+Per-stage timings are printed as percentiles and written as JSON, to compare runs.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import tempfile
+import time
+import types
+import uuid
+
+import numpy as np
+from chainlit.context import context_var
+from langchain_core.embeddings import Embeddings
+
+import ingest
+import main
+import utils.http_fetch as http_fetch
+from benchmarks.fake_ollama import start_server as start_ollama
+from benchmarks.fake_wiki import start_server as start_wiki
+from utils import metrics
+from utils.embedding_cache import CachedEmbeddings, set_embeddings
+from utils.ollama_pool import OllamaPool
+from utils.session_store import SQLiteSessionStore
+from web_scraping import web_scraping
+
+BOSSES = ["Skeletron_Prime", "The_Twins", "The_Destroyer", "Plantera", "Golem"]
+# Each list is one chat session: a first question, then follow-ups. The first questions are
+# asked again every round (answer cache), the stat questions take the stats table path
+SESSIONS = [
+    ["What are the spawn conditions of Skeletron Prime?", "What does it drop?", "And its defense in Expert mode?",
+     "What is Skeletron Prime's max life in Master mode?"],
+    ["How do I beat The Twins?", "What about Master mode?", "And what do they drop?"],
+    ["Which items does Plantera drop?", "How much health does it have?", "Tell me about its attacks."],
+    ["What are Prime Cannon's attacks?", "Which buffs help against it?", "And what does it drop?"],
+]
+# Stage timings reported, in pipeline order
+STAGES = [
+    'embedding_model_load_seconds', 'index_load_seconds', 'topic_detection_seconds', 'stat_lookup_seconds',
+    'llm_queue_wait_seconds', 'condense_seconds', 'retrieval_seconds', 'prompt_build_seconds',
+    'generation_seconds', 'time_to_first_token_seconds', 'session_store_read_seconds',
+    'session_store_write_seconds', 'memory_compaction_seconds', 'request_seconds',
+]
+
+class TopicEmbeddings(Embeddings):
+    """Fake embeddings that are stable per topic, so topic detection behaves as with a real model.
+
+    Every text shares a common "Terraria" direction, a text naming a boss adds that boss's
+    direction, and a small per-text component keeps texts apart: follow-ups that name no
+    boss stay close to the conversation, questions about the same boss are closer still.
+    """
+
+    def __init__(self, bosses, size=384):
+        self.size = size
+        self.bosses = {boss.replace('_', ' ').lower(): self._direction(boss) for boss in bosses}
+        self.common = self._direction("terraria")
+
+    def _direction(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return vector / np.linalg.norm(vector)
+
+    def _embed(self, text):
+        lowered = text.lower()
+        vector = self.common + 0.3 * self._direction(text)
+        for name, direction in self.bosses.items():
+            if name in lowered:
+                vector = vector + direction
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+def use_fake_embeddings(cache_dir):
+    embeddings = CachedEmbeddings(lambda: TopicEmbeddings(BOSSES), model_name="fake-topic-384", cache_dir=cache_dir)
+    set_embeddings(embeddings, main.EMBEDDINGS_MODEL, device='cpu')
+
+class BenchmarkMessage:
+    """Stands in for cl.Message: keeps the content, sends nothing."""
+
+    def __init__(self, content="", **kwargs):
+        self.content = content
+        self.id = uuid.uuid4().hex
+
+    async def send(self):
+        return self
+
+    async def update(self):
+        return True
+
+    async def remove(self):
+        return True
+
+    async def stream_token(self, token):
+        self.content += token
+
+def build_corpus(work_dir, index_type):
+    """Scrape the fixture pages and ingest them, into work_dir."""
+    server, base_url = start_wiki()
+    try:
+        http_fetch.CACHE_DIR = os.path.join(work_dir, "cache", "http")
+        data_path = os.path.join(work_dir, "data")
+        web_scraping([f"{base_url}{boss}" for boss in BOSSES], workers=4, output_root=data_path)
+    finally:
+        server.shutdown()
+
+    ingest.DATA_PATH = data_path
+    ingest.DB_FAISS_PATH = os.path.join(work_dir, "vectorstores", "db_faiss")
+    ingest.STATS_DB_PATH = os.path.join(work_dir, "vectorstores", "boss_stats.sqlite")
+    with metrics.timed('ingest_seconds'):
+        ingest.create_vector_db(index_type=index_type)
+    if not os.path.exists(os.path.join(ingest.DB_FAISS_PATH, ingest.MANIFEST_NAME)):
+        raise RuntimeError("Ingest did not produce an index, see the error above.")
+
+async def run_session(questions):
+    """One chat through main.py's handlers, in its own (fake) Chainlit context."""
+    session = types.SimpleNamespace(id=uuid.uuid4().hex, thread_id=uuid.uuid4().hex, user_env={},
+                                    chat_settings={}, user=None, chat_profile=None, client_type="webapp")
+    context_var.set(types.SimpleNamespace(session=session))
+    await main.start()
+    for question in questions:
+        await main.on_message(BenchmarkMessage(question))
+
+async def run_sessions(rounds):
+    resources = main.get_shared_resources()
+    resources['embeddings'].load()
+    main._warm.set()
+    for _ in range(rounds):
+        # Each session runs in its own task, so each gets its own context
+        await asyncio.gather(*(run_session(questions) for questions in SESSIONS))
+        # Let the background memory compactions finish before the next round
+        while main._compacting_sessions:
+            await asyncio.sleep(0.01)
+
+def run(rounds, index_type, token_delay, fake_embeddings, output):
+    with tempfile.TemporaryDirectory() as work_dir:
+        if fake_embeddings:
+            use_fake_embeddings(os.path.join(work_dir, "cache", "embeddings"))
+        build_corpus(work_dir, index_type)
+
+        main.DB_FAISS_PATH = ingest.DB_FAISS_PATH
+        main.STATS_DB_PATH = ingest.STATS_DB_PATH
+        main._session_store = SQLiteSessionStore(os.path.join(work_dir, "cache", "sessions.sqlite"))
+        main.cl.Message = BenchmarkMessage
+        ollama, ollama_url = start_ollama(token_delay=token_delay, model=main.LLAMA_MODEL)
+        main._ollama_pool = OllamaPool([ollama_url], model=main.LLAMA_MODEL)
+        try:
+            asyncio.run(run_sessions(rounds))
+        finally:
+            ollama.shutdown()
+            main._session_store.close()
+
+    snapshot = metrics.snapshot()
+    print(f"\n{'stage':<32}{'count':>7}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}")
+    stages = {}
+    for name in ['ingest_seconds'] + STAGES:
+        summary = snapshot['timings'].get(name)
+        if not summary:
+            continue
+        stages[name] = {key: (round(value * 1000, 3) if key != 'count' and value is not None else value)
+                        for key, value in summary.items()}
+        print(f"{name:<32}{summary['count']:>7}{stages[name]['p50']:>10}{stages[name]['p95']:>10}{stages[name]['p99']:>10}")
+
+    counters = snapshot['counters']
+    print("\nPaths: " + ", ".join(f"{name} {int(counters.get(name, 0))}" for name in (
+        'stat_fast_path_hits', 'answer_cache_hits', 'condense_calls', 'condense_skipped', 'topic_changes',
+        'memory_compactions')))
+    errors = {name: count for name, count in counters.items() if name.startswith('errors')}
+    if errors:
+        print(f"Errors: {errors}")
+
+    result = {
+        'config': {'rounds': rounds, 'index_type': index_type, 'token_delay': token_delay,
+                   'fake_embeddings': fake_embeddings, 'python': platform.python_version()},
+        'stages_ms': stages,
+        'token_samples': {name: snapshot['timings'][name] for name in ['prompt_tokens', 'history_tokens', 'answer_tokens']
+                          if name in snapshot['timings']},
+        'counters': snapshot['counters'],
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+        print(f"\nResults written to {output}")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark.")
+    parser.add_argument('--rounds', type=int, default=3, help="Times the question set is replayed")
+    parser.add_argument('--index-type', choices=ingest.INDEX_TYPES, default='flat')
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Fake LLM delay per token in seconds")
+    parser.add_argument('--fake-embeddings', action='store_true', help="Use deterministic fake embeddings (no model download)")
+    parser.add_argument('--output', default="benchmark_e2e.json", help="JSON result file")
+    args = parser.parse_args()
+
+    run(args.rounds, args.index_type, args.token_delay, args.fake_embeddings, args.output)
@@ -0,0 +1,97 @@
+"""Local stand-in for an Ollama server (/api/tags and streaming /api/generate), to exercise the backend pool offline."""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Skeletron Prime has 28000 max life in Normal mode."
+
+class OllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by start_server()
+    model = "llama3.2:3b"
+    reply = DEFAULT_REPLY
+    token_delay = 0.0
+    # Mutable flags shared with the test code: {'down': bool, 'generate_calls': int}
+    state = None
+
+    def do_GET(self):
+        if self.state['down']:
+            self._send_json(503, {'error': 'unavailable'})
+        elif self.path == '/api/tags':
+            self._send_json(200, {'models': [{'name': self.model, 'model': self.model}]})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if self.path != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+        with _lock:
+            self.state['generate_calls'] += 1
+        if self.state['down']:
+            self._send_json(500, {'error': 'backend failure'})
+            return
+
+        # Streamed as NDJSON, one token per line like Ollama does
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for word in self.reply.split(' '):
+            time.sleep(self.token_delay)
+            self._write_chunk({'model': request.get('model'), 'response': word + ' ', 'done': False})
+        self._write_chunk({'model': request.get('model'), 'response': '', 'done': True, 'done_reason': 'stop',
+                           'eval_count': len(self.reply.split(' '))})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_lock = threading.Lock()
+
+def start_server(port=0, reply=DEFAULT_REPLY, token_delay=0.0, model="llama3.2:3b"):
+    """Start a fake Ollama in a background thread, returns (server, base_url).
+
+    `server.state['down'] = True` makes it fail every request until set back to False.
+    """
+    state = {'down': False, 'generate_calls': 0}
+    handler = type('OllamaHandler', (OllamaHandler,), {'reply': reply, 'token_delay': token_delay,
+                                                       'model': model, 'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake Ollama endpoints on localhost.")
+    parser.add_argument('--port', type=int, default=11500, help="Port of the first server")
+    parser.add_argument('--count', type=int, default=2, help="Number of servers (consecutive ports)")
+    parser.add_argument('--token-delay', type=float, default=0.05, help="Delay per streamed token in seconds")
+    args = parser.parse_args()
+
+    servers = [start_server(args.port + i, token_delay=args.token_delay) for i in range(args.count)]
+    print("OLLAMA_BASE_URLS=" + ','.join(base_url for _, base_url in servers))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server, _ in servers:
+            server.shutdown()
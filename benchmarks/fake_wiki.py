@@ -0,0 +1,73 @@
+"""Local stand-in for the Terraria wiki so the scraper can be exercised without network."""
+import argparse
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_PAGE = "Skeletron_Prime"
+
+def load_page(name):
+    # Any boss name is served with its own fixture if there is one, otherwise with the default page
+    path = os.path.join(FIXTURE_DIR, f"{name}.html")
+    if not os.path.exists(path):
+        path = os.path.join(FIXTURE_DIR, f"{DEFAULT_PAGE}.html")
+    with open(path, 'rb') as file:
+        return file.read()
+
+class WikiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Simulated server latency in seconds, set by start_server()
+    latency = 0.0
+
+    def do_GET(self):
+        name = self.path.rstrip('/').rsplit('/', 1)[-1]
+        # Pages named Missing_* answer 404, to check that one bad page doesn't abort a batch
+        if name.startswith("Missing"):
+            self._send(404, b"Not found")
+            return
+
+        body = load_page(name)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, b"", etag)
+            return
+
+        time.sleep(self.latency)
+        self._send(200, body, etag)
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(port=0, latency=0.0):
+    """Start the fake wiki in a background thread, returns (server, base_url)."""
+    handler = type('WikiHandler', (WikiHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/wiki/"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the wiki fixtures on localhost.")
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help="Artificial delay per page in seconds")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, args.latency)
+    print(f"Fake wiki serving at {base_url}<Boss_Name>")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
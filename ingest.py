@@ -1,18 +1,74 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
-from langchain_huggingface import HuggingFaceEmbeddings
+from utils.bm25 import BM25Index
+from utils.compact_store import compact_store_exists, load_compact_store, save_compact_store
+from utils.embedding_cache import get_embeddings
+from utils.stats_store import save_stats_table
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+import numpy as np
+import argparse
+import fnmatch
+import hashlib
+import json
 import os
+import re
+import shutil
 
-DATA_PATH = "data/Skeletron_Prime"
+DATA_PATH = "data"
 DB_FAISS_PATH = "vectorstores/db_faiss"
+MANIFEST_NAME = "manifest.json"
+SECTIONS_FILE = "sections.jsonl"
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'pq', 'ivfpq')
+DEFAULT_INDEX = {'type': 'flat', 'params': {}}
+# Per-boss sub-indexes live in this sub folder of the main index, one folder per boss slug
+PARTITIONS_DIR = "bosses"
+# Lexical (BM25) inverted index over the same chunks, saved inside the index folder
+BM25_FILE = "bm25.json"
+# Typed boss stats (one row per boss/form/stat/mode), answered without the LLM by main.py
+STATS_FILE = "stats.jsonl"
+STATS_DB_PATH = "vectorstores/boss_stats.sqlite"
+
+def load_section_records(sections_path):
+    """Load the structured section records written by web_scraping.py, metadata included."""
+    documents = []
+    with open(sections_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            metadata = {key: value for key, value in record.items() if key != 'text' and value is not None}
+            # Keep the "Section: text" layout the PDFs had, the section name helps retrieval
+            documents.append(Document(page_content=f"{record['section']}: {record['text']}", metadata=metadata))
+    return documents
 
 def load_documents(data_path, file_pattern="*.pdf"):
-    """Load PDF documents from a directory."""
+    """Load documents from a directory: section records where a folder has them, PDFs otherwise."""
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"The specified data path '{data_path}' does not exist.")
-    pdf_loader = DirectoryLoader(data_path, glob=file_pattern, loader_cls=PyPDFLoader)
-    return pdf_loader.load()
+    documents = []
+    for folder, _, files in sorted(os.walk(data_path)):
+        if SECTIONS_FILE in files:
+            documents.extend(load_section_records(os.path.join(folder, SECTIONS_FILE)))
+        elif any(fnmatch.fnmatch(name, file_pattern) for name in files):
+            pdf_loader = DirectoryLoader(folder, glob=file_pattern, loader_cls=PyPDFLoader)
+            for doc in pdf_loader.load():
+                # PDFs are saved as data/<Boss_Name>/<Section>.pdf
+                source = doc.metadata.get('source', '')
+                doc.metadata.setdefault('boss', os.path.basename(os.path.dirname(source)).replace('_', ' '))
+                doc.metadata.setdefault('section', os.path.splitext(os.path.basename(source))[0])
+                documents.append(doc)
+    return documents
+
+def load_stat_rows(data_path):
+    """Load the stat rows written by web_scraping.py for every boss."""
+    rows = []
+    for folder, _, files in sorted(os.walk(data_path)):
+        if STATS_FILE in files:
+            with open(os.path.join(folder, STATS_FILE), 'r', encoding='utf-8') as file:
+                rows.extend(json.loads(line) for line in file if line.strip())
+    return rows
 
 def split_documents(documents, chunk_size=500, chunk_overlap=50):
     """Split documents into chunks using a text splitter."""
@@ -20,17 +76,234 @@ def split_documents(documents, chunk_size=500, chunk_overlap=50):
     return text_splitter.split_documents(documents)
 
 def create_embeddings(model_name='sentence-transformers/all-MiniLM-L6-v2', device='cpu'):
-    """Initialize the HuggingFace embeddings."""
-    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device})
+    """Initialize the HuggingFace embeddings behind the persistent embedding cache."""
+    return get_embeddings(model_name=model_name, device=device)
+
+def chunk_id(doc):
+    """Content hash of a chunk, stable across runs as long as its source and text are unchanged."""
+    source = doc.metadata.get('source', '')
+    return hashlib.sha256(f"{source}\n{doc.page_content}".encode('utf-8')).hexdigest()
+
+def index_chunks(texts):
+    """Map chunk ids to chunks, identical chunks from the same source collapse into one."""
+    return {chunk_id(doc): doc for doc in texts}
+
+def load_manifest(db_path):
+    """Load the chunk manifest ({chunk id: source}) saved next to the index, if any."""
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def index_config(index_type='flat', index_params=None):
+    return {'type': index_type, 'params': index_params or {}}
+
+def boss_slug(boss):
+    return re.sub(r'[^A-Za-z0-9]+', '_', boss).strip('_')
+
+def build_manifest(chunks, index_type='flat', index_params=None):
+    ids = sorted(chunks)
+    config = index_config(index_type, index_params)
+    # The version changes whenever the set of indexed chunks or the index structure changes
+    version = hashlib.sha256('\n'.join(ids + [json.dumps(config, sort_keys=True)]).encode('utf-8')).hexdigest()[:16]
+    chunk_bosses = {cid: doc.metadata['boss'] for cid, doc in chunks.items() if doc.metadata.get('boss')}
+    return {
+        'version': version,
+        'index': config,
+        'chunks': {cid: doc.metadata.get('source', '') for cid, doc in chunks.items()},
+        'chunk_bosses': chunk_bosses,
+        'bosses': {boss: boss_slug(boss) for boss in sorted(set(chunk_bosses.values()))},
+    }
+
+def build_lexical_index(chunks):
+    """BM25 inverted index keyed by the same chunk ids as the vector store (no embedding needed)."""
+    return BM25Index.build(list(chunks), [doc.page_content for doc in chunks.values()])
+
+def build_partitions(chunks, embeddings, bosses=None):
+    """Build a small flat store per boss (only for `bosses` when given), keyed by boss name.
+
+    The vectors come from the embedding cache, so this doesn't encode anything twice.
+    """
+    groups = {}
+    for cid, doc in chunks.items():
+        boss = doc.metadata.get('boss')
+        if boss and (bosses is None or boss in bosses):
+            groups.setdefault(boss, {})[cid] = doc
+    return {boss: build_vector_store(list(group.values()), list(group), embeddings) for boss, group in groups.items()}
+
+def store_versions(db_path):
+    """Saved versions of the store next to db_path (db_faiss.1, db_faiss.2, ...), oldest first."""
+    parent, name = os.path.split(db_path)
+    versions = [entry for entry in os.listdir(parent or '.')
+                if entry.startswith(f"{name}.") and entry[len(name) + 1:].isdigit()]
+    return sorted(versions, key=lambda entry: int(entry[len(name) + 1:]))
+
+def save_vector_store(db, manifest, db_path, partitions=None, keep_partitions=(), lexical=None):
+    """Save the index, its per-boss partitions (compact format, see utils/compact_store.py),
+    the BM25 index and the manifest into a new version folder, then point db_path at it.
+    Partitions in keep_partitions are copied unchanged.
+
+    db_path is a symlink to the current version folder and is replaced in one rename, so a
+    reader opening the store sees the old or the new version, never a missing or half
+    written one. The previous version is kept for readers still loading it.
+    """
+    parent = os.path.dirname(db_path) or '.'
+    os.makedirs(parent, exist_ok=True)
+    versions = store_versions(db_path)
+    version_path = f"{db_path}.{int(versions[-1].rsplit('.', 1)[1]) + 1 if versions else 1}"
+
+    save_compact_store(db, version_path)
+    if lexical is not None:
+        lexical.save(os.path.join(version_path, BM25_FILE))
+    for boss, partition in (partitions or {}).items():
+        save_compact_store(partition, os.path.join(version_path, PARTITIONS_DIR, boss_slug(boss)))
+    for boss in keep_partitions:
+        existing = os.path.join(db_path, PARTITIONS_DIR, boss_slug(boss))
+        if os.path.exists(existing):
+            shutil.copytree(existing, os.path.join(version_path, PARTITIONS_DIR, boss_slug(boss)))
+    with open(os.path.join(version_path, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+
+    previous = os.readlink(db_path) if os.path.islink(db_path) else None
+    link_path = f"{db_path}.link"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    try:
+        os.symlink(os.path.basename(version_path), link_path, target_is_directory=True)
+    except OSError:
+        # No symlinks (e.g. Windows without developer mode): swap the folders instead, a
+        # reader can find db_path missing between the two renames
+        old_path = f"{db_path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(db_path):
+            os.replace(db_path, old_path)
+        os.replace(version_path, db_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return
+    old_path = f"{db_path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.isdir(db_path) and not os.path.islink(db_path):
+        # Stores saved before the versioned layout are a plain folder, moved aside once
+        os.replace(db_path, old_path)
+    os.replace(link_path, db_path)
+    shutil.rmtree(old_path, ignore_errors=True)
 
-def create_vector_store(texts, embeddings, db_path):
+    keep = {os.path.basename(version_path), os.path.basename(previous or '')}
+    for entry in store_versions(db_path):
+        if entry not in keep:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+def create_faiss_index(vectors, index_type='flat', nlist=100, nprobe=10, hnsw_m=32, ef_construction=40,
+                       ef_search=64, pq_m=16, pq_bits=8):
+    """Create an empty, trained FAISS index of the requested type for `vectors`.
+
+    flat is exact search, ivf/ivfpq probe `nprobe` of `nlist` clusters, hnsw is a graph
+    index and pq/ivfpq store product-quantized codes of `pq_m` sub-vectors x `pq_bits` bits.
+    """
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}.")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    # Small corpora can't train many clusters/centroids, clamp to what the data supports
+    nlist = max(1, min(nlist, n // 39))
+    pq_bits = max(1, min(pq_bits, int(np.log2(max(n, 2)))))
+    if index_type in ('pq', 'ivfpq') and dim % pq_m:
+        raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}.")
+
+    spec = {
+        'flat': "Flat",
+        'ivf': f"IVF{nlist},Flat",
+        'hnsw': f"HNSW{hnsw_m}",
+        'pq': f"PQ{pq_m}x{pq_bits}",
+        'ivfpq': f"IVF{nlist},PQ{pq_m}x{pq_bits}",
+    }[index_type]
+    index = faiss.index_factory(dim, spec)
+
+    if index_type == 'hnsw':
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    if not index.is_trained:
+        index.train(vectors)
+    if index_type in ('ivf', 'ivfpq'):
+        faiss.extract_index_ivf(index).nprobe = min(nprobe, nlist)
+    return index
+
+def build_vector_store(docs, ids, embeddings, index_type='flat', index_params=None):
+    """Embed the chunks and load them into a FAISS store backed by the requested index type."""
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    index = create_faiss_index(vectors, index_type, **(index_params or {}))
+    db = FAISS(embeddings, index, InMemoryDocstore(), {})
+    db.add_embeddings(
+        list(zip([doc.page_content for doc in docs], vectors)),
+        metadatas=[doc.metadata for doc in docs],
+        ids=ids,
+    )
+    return db
+
+def create_vector_store(texts, embeddings, db_path, index_type='flat', index_params=None):
     """Create and save a FAISS vector database."""
-    db = FAISS.from_documents(texts, embeddings)
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    db.save_local(db_path)
-    print(f"Vector database saved at '{db_path}'.")
+    chunks = index_chunks(texts)
+    db = build_vector_store(list(chunks.values()), list(chunks), embeddings, index_type, index_params)
+    partitions = build_partitions(chunks, embeddings)
+    manifest = build_manifest(chunks, index_type, index_params)
+    save_vector_store(db, manifest, db_path, partitions, lexical=build_lexical_index(chunks))
+    print(f"Vector database saved at '{db_path}' ({len(chunks)} chunks, {index_type} index, "
+          f"{len(partitions)} boss partitions).")
+
+def update_vector_store(texts, embeddings, db_path, index_type='flat', index_params=None):
+    """Incrementally update a saved FAISS database: embed only new or changed chunks and
+    drop chunks whose source changed or disappeared."""
+    manifest = load_manifest(db_path)
+    if manifest is None or not compact_store_exists(db_path):
+        print("No manifest or compact store found, building the vector store from scratch.")
+        create_vector_store(texts, embeddings, db_path, index_type, index_params)
+        return
+    if manifest.get('index', DEFAULT_INDEX) != index_config(index_type, index_params):
+        print("Index type or parameters changed, rebuilding the vector store.")
+        create_vector_store(texts, embeddings, db_path, index_type, index_params)
+        return
+
+    chunks = index_chunks(texts)
+    known = manifest['chunks']
+    to_add = [cid for cid in chunks if cid not in known]
+    to_delete = [cid for cid in known if cid not in chunks]
 
-def create_vector_db():
+    if not to_add and not to_delete:
+        print("Vector database is up to date, nothing to embed.")
+        return
+    if to_delete and index_type in ('hnsw', 'ivf', 'ivfpq'):
+        # HNSW graphs don't support removal and IVF removal doesn't renumber the remaining
+        # vectors, so the store's positional ids would point past them. Rebuilding reuses
+        # the cached embeddings.
+        print(f"{index_type} indexes can't drop vectors, rebuilding the vector store.")
+        create_vector_store(texts, embeddings, db_path, index_type, index_params)
+        return
+
+    db = load_compact_store(db_path, embeddings, mmap_index=False)
+    if to_delete:
+        db.delete(to_delete)
+    if to_add:
+        db.add_documents([chunks[cid] for cid in to_add], ids=to_add)
+
+    # Only the partitions of bosses that gained or lost chunks are rebuilt
+    old_bosses = manifest.get('chunk_bosses', {})
+    changed = {old_bosses[cid] for cid in to_delete if cid in old_bosses}
+    changed |= {chunks[cid].metadata['boss'] for cid in to_add if chunks[cid].metadata.get('boss')}
+    partitions = build_partitions(chunks, embeddings, bosses=changed)
+
+    new_manifest = build_manifest(chunks, index_type, index_params)
+    unchanged = [boss for boss in new_manifest['bosses'] if boss not in changed and boss in manifest.get('bosses', {})]
+    missing = [boss for boss in new_manifest['bosses'] if boss not in changed and boss not in unchanged]
+    partitions.update(build_partitions(chunks, embeddings, bosses=set(missing)))
+    save_vector_store(db, new_manifest, db_path, partitions, keep_partitions=unchanged,
+                      lexical=build_lexical_index(chunks))
+    print(f"Vector database updated at '{db_path}': {len(to_add)} chunks embedded, "
+          f"{len(to_delete)} removed, {len(chunks) - len(to_add)} reused, {len(partitions)} boss partitions rebuilt.")
+
+def create_vector_db(incremental=False, index_type='flat', index_params=None):
     """Main function to create the vector database."""
     try:
         print("Loading documents...")
@@ -42,12 +315,41 @@ def create_vector_db():
         print("Initializing embeddings...")
         embeddings = create_embeddings()
 
-        print("Creating and saving the vector store...")
-        create_vector_store(texts, embeddings, DB_FAISS_PATH)
+        if incremental:
+            print("Updating the vector store...")
+            update_vector_store(texts, embeddings, DB_FAISS_PATH, index_type, index_params)
+        else:
+            print("Creating and saving the vector store...")
+            create_vector_store(texts, embeddings, DB_FAISS_PATH, index_type, index_params)
+
+        stat_rows = load_stat_rows(DATA_PATH)
+        save_stats_table(stat_rows, STATS_DB_PATH)
+        print(f"Saved {len(stat_rows)} stat rows to {STATS_DB_PATH}")
         
+        print(f"Embedding cache: {embeddings.stats()}")
         print("Vector database creation completed successfully.")
     except Exception as e:
         print(f"Error: {e}")
 
+def add_index_arguments(parser):
+    """Command line options for the FAISS index parameters."""
+    parser.add_argument('--nlist', type=int, help="IVF: number of clusters")
+    parser.add_argument('--nprobe', type=int, help="IVF: clusters visited per query")
+    parser.add_argument('--hnsw-m', type=int, help="HNSW: neighbours per node")
+    parser.add_argument('--ef-construction', type=int, help="HNSW: candidate list size while building")
+    parser.add_argument('--ef-search', type=int, help="HNSW: candidate list size while searching")
+    parser.add_argument('--pq-m', type=int, help="PQ: number of sub-vectors (must divide the dimension)")
+    parser.add_argument('--pq-bits', type=int, help="PQ: bits per sub-vector code")
+
+def index_params_from_args(args):
+    names = ['nlist', 'nprobe', 'hnsw_m', 'ef_construction', 'ef_search', 'pq_m', 'pq_bits']
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
 if __name__ == "__main__":
-    create_vector_db()
+    parser = argparse.ArgumentParser(description="Build the FAISS vector database from the scraped documents.")
+    parser.add_argument('--incremental', action='store_true', help="Only embed new or changed chunks and drop removed ones")
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat', help="FAISS index structure")
+    add_index_arguments(parser)
+    args = parser.parse_args()
+
+    create_vector_db(incremental=args.incremental, index_type=args.index_type, index_params=index_params_from_args(args))
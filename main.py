@@ -1,29 +1,45 @@
-import chainlit as cl
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Langchain imports
-from langchain_core.prompts import PromptTemplate
-from langchain.schema.runnable.config import RunnableConfig
-from langchain.memory import ConversationBufferWindowMemory, ConversationBufferMemory
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import ConversationalRetrievalChain
-from langchain.callbacks.manager import CallbackManager
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+# Startup clock; with STARTUP_PROFILE also times every import until warm-up (see utils/profiler.py)
+from utils import profiler
+profiler.start()
 
-# Langchain-OLLAMA specific import
-from langchain_ollama import OllamaLLM
+import chainlit as cl
 
 # Chainlit imports
 from chainlit.types import ThreadDict
 
 # FastAPI imports
 from fastapi import Request, Response
+from fastapi.responses import PlainTextResponse
+from chainlit.server import app
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from utils import metrics, tracing
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.answer_cache import ANSWER_CACHE_FILE, SemanticAnswerCache, index_version
+from utils.embedding_cache import get_embeddings
+from utils.memory import CompactingMemory
+from utils.session_store import create_session_store
+from utils.topic_tracker import TopicTracker
+from utils.stats_store import StatsTable, answer_stat_question
+
+# LangChain, FAISS, the Ollama client and the embedding model are imported where they are
+# first used, so that the server starts accepting connections without waiting for them
 
 # Constants
 DB_FAISS_PATH = "vectorstores/db_faiss"
+PARTITIONS_DIR = "bosses"
+BM25_FILE = "bm25.json"
+STATS_DB_PATH = "vectorstores/boss_stats.sqlite"
 LLAMA_MODEL = "llama3.2:3b"
 EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Warm up (imports, model and index loading) in the background instead of before the server
+# accepts connections; a chat that arrives earlier waits for the warm-up to finish
+FAST_START = os.environ.get("FAST_START", "true").lower() in ("1", "true", "yes")
 
 # Custom Prompt Template
 custom_prompt_template = """
@@ -40,61 +56,289 @@ Answer:
 
 def set_custom_prompt():
     """Return a custom prompt template."""
+    from langchain_core.prompts import PromptTemplate
+
     return PromptTemplate(template=custom_prompt_template, input_variables=['chat_history', 'context', 'question'])
 
-def load_llm():
-    """Load the Ollama LLM with required settings."""
+_ollama_pool = None
+
+def get_ollama_pool():
+    """The pool of Ollama servers (OLLAMA_BASE_URLS), shared by every LLM of this process."""
+    global _ollama_pool
+    from utils.ollama_pool import OLLAMA_BASE_URLS, OllamaPool
+
+    if _ollama_pool is None:
+        _ollama_pool = OllamaPool(OLLAMA_BASE_URLS, model=LLAMA_MODEL)
+    return _ollama_pool
+
+_session_store = None
+
+def get_session_store():
+    """Conversation state outside this process (SESSION_STORE), so any worker can serve a turn."""
+    global _session_store
+    if _session_store is None:
+        _session_store = create_session_store()
+    return _session_store
+
+# Expired conversations are purged from the store at most this often, when a chat ends
+SESSION_PURGE_INTERVAL = 3600
+_last_session_purge = 0.0
+
+def purge_expired_sessions():
+    global _last_session_purge
+    now = time.monotonic()
+    if _last_session_purge and now - _last_session_purge < SESSION_PURGE_INTERVAL:
+        return
+    _last_session_purge = now
+    try:
+        purged = get_session_store().purge()
+        metrics.incr('sessions_purged', purged)
+    except Exception as e:
+        print(f"Session purge failed: {e}")
+
+def session_key():
+    # The thread id is the same on every worker and survives a resume, the session id isn't
+    return cl.context.session.thread_id
+
+def load_llm(tags=None):
+    """Load the Ollama LLM with required settings. Tokens are streamed to the UI by a
+    per-message callback handler (see on_message), which only streams LLMs tagged ANSWER_TAG."""
+    from utils.ollama_pool import PooledOllamaLLM
+
     try:
-        llm = OllamaLLM(
-            model=LLAMA_MODEL,
+        llm = PooledOllamaLLM(
+            pool=get_ollama_pool(),
             verbose=True,
-            callback_manager=CallbackManager([StreamingStdOutCallbackHandler()]),
+            tags=tags,
         )
         return llm
     except Exception as e:
         raise RuntimeError(f"Failed to load LLM: {e}")
 
-def compute_similarity(question, previous_question):
-    """Compute cosine similarity between two questions."""
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL)
+def embed_question(question):
+    """The one embedding computed per message, shared by topic detection and the answer cache."""
     try:
-        question_embedding = embeddings.embed_query(question)
-        prev_embedding = embeddings.embed_query(previous_question)
-        return cosine_similarity([question_embedding], [prev_embedding])[0][0]
+        return get_embeddings(EMBEDDINGS_MODEL).embed_query(question)
     except Exception as e:
-        raise RuntimeError(f"Error in computing similarity: {e}")
+        raise RuntimeError(f"Error in embedding the question: {e}")
+
+def reset_memory_if_topic_changes(question_vector, memory, topic):
+    """Reset memory if the question drifted away from the conversation's topic, returns True
+    when it was reset. The topic tracker keeps the earlier questions' embeddings as a centroid,
+    so nothing but the new question is encoded."""
+    with tracing.span('topic_detection'):
+        changed = topic.update(question_vector)
+    if changed and memory.turns:
+        memory.clear()
+        return True
+    return False
 
-def reset_memory_if_topic_changes(new_question, memory):
-    """Reset memory if a topic change is detected."""
-    if memory.chat_memory.messages:
-        last_question = memory.chat_memory.messages[-1].content
-        if compute_similarity(new_question, last_question) < 0.15:
-            memory.clear()
+def retrieval_qa_chain(llm, retriever, condense_llm=None):
+    """Set up the Conversational Retrieval Chain with custom prompt. The chain keeps no memory,
+    on_message passes the session's history and the chain trims it to its token budget."""
+    from utils.qa_chain import BudgetedRetrievalChain
 
-def retrieval_qa_chain(llm, db, memory):
-    """Set up the Conversational Retrieval Chain with custom prompt."""
     prompt = set_custom_prompt()
-    return ConversationalRetrievalChain.from_llm(
+    return BudgetedRetrievalChain.from_llm(
         llm=llm,
-        retriever=db.as_retriever(search_kwargs={'k': 2}),
-        memory=memory,
+        retriever=retriever,
+        condense_question_llm=condense_llm,
         return_source_documents=True,
         combine_docs_chain_kwargs={"prompt": prompt},
         verbose=False
     )
 
+# Read-only resources shared by every session of this process
+_shared_resources = {}
+_shared_resources_lock = threading.Lock()
+
+# Process-wide answer cache, emptied whenever the index version changes
+answer_cache = SemanticAnswerCache()
+
+# Limits concurrent generations against Ollama, the rest wait in a bounded, per-user fair queue
+admission = AdmissionController()
+
+def get_shared_resources():
+    """Load the embeddings, FAISS index and LLM client once per process."""
+    from utils.compact_store import load_compact_store
+    from utils.retrieval import BossRouter
+    from utils.streaming import ANSWER_TAG
+
+    with _shared_resources_lock:
+        if not _shared_resources:
+            embeddings = get_embeddings(EMBEDDINGS_MODEL, device='cpu')
+            # DB_FAISS_PATH links to the current version folder, resolved once so a re-ingest
+            # swapping it meanwhile can't mix files of two versions
+            db_path = os.path.realpath(DB_FAISS_PATH)
+            # The version of the index this process serves, read with it: the manifest on disk
+            # moves on after a re-ingest while the loaded index stays the same until a restart
+            version = index_version(db_path)
+            with metrics.timed('index_load_seconds'):
+                # Memory-mapped, read-only: worker processes share the index and chunks in the page cache
+                db = load_compact_store(db_path, embeddings)
+                partitions = load_partitions(embeddings, db_path)
+                lexical = load_lexical_index(db_path)
+                stats = StatsTable.load(STATS_DB_PATH)
+            # Same model twice: only the answer LLM is tagged for streaming, the follow-up
+            # question rephrasing stays out of the chat window
+            llm = load_llm(tags=[ANSWER_TAG])
+            condense_llm = load_llm()
+            partition_ids = {boss: set(store.index_to_docstore_id.values()) for boss, store in partitions.items()}
+            _shared_resources.update(embeddings=embeddings, db=db, partitions=partitions, partition_ids=partition_ids,
+                                     router=BossRouter(partitions), lexical=lexical, stats=stats, llm=llm,
+                                     condense_llm=condense_llm, index_version=version)
+    return _shared_resources
+
+def load_lexical_index(db_path=DB_FAISS_PATH):
+    """Load the BM25 index built by ingest.py, if there is one."""
+    from utils.bm25 import BM25Index
+
+    path = os.path.join(db_path, BM25_FILE)
+    return BM25Index.load(path) if os.path.exists(path) else None
+
+def load_partitions(embeddings, db_path=DB_FAISS_PATH):
+    """Load the per-boss sub-indexes listed in the ingest manifest, keyed by boss name.
+    They are memory-mapped like the main index, so their copy of the vectors lives in the
+    shared page cache too."""
+    from utils.compact_store import load_compact_store
+
+    manifest_path = os.path.join(db_path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        bosses = json.load(file).get('bosses', {})
+    partitions = {}
+    for boss, slug in bosses.items():
+        path = os.path.join(db_path, PARTITIONS_DIR, slug)
+        if os.path.exists(path):
+            partitions[boss] = load_compact_store(path, embeddings)
+    return partitions
+
 def qa_bot():
-    """Initialize the QA bot with embeddings, database, LLM, and memory."""
+    """Initialize the QA bot: shared embeddings, database and LLM, plus a per-session retriever."""
+    from utils.retrieval import BossRoutedRetriever
+
     try:
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL, model_kwargs={'device': 'cpu'})
-        db = FAISS.load_local(DB_FAISS_PATH, embeddings, allow_dangerous_deserialization=True)
-        llm = load_llm()
+        with tracing.span('qa_bot'):
+            resources = get_shared_resources()
 
-        memory = ConversationBufferWindowMemory(k=3, memory_key="chat_history", input_key="question", output_key="answer", return_messages=True)
-        return retrieval_qa_chain(llm, db, memory)
+            # The retriever is per session since it carries the last routed boss over
+            retriever = BossRoutedRetriever(db=resources['db'], partitions=resources['partitions'],
+                                            partition_ids=resources['partition_ids'], router=resources['router'],
+                                            lexical=resources['lexical'], k=2)
+            return retrieval_qa_chain(resources['llm'], retriever, resources['condense_llm'])
     except Exception as e:
+        metrics.incr('errors{stage="qa_bot"}')
         raise RuntimeError(f"Failed to initialize QA bot: {e}")
 
+def format_sources(documents):
+    """One line per distinct source page section, appended under a streamed answer."""
+    lines = []
+    for doc in documents:
+        boss = doc.metadata.get('boss')
+        section = doc.metadata.get('section')
+        source = doc.metadata.get('source')
+        name = ' - '.join(part for part in [boss, section] if part) or source
+        line = f"- {name} ({source})" if source and source != name else f"- {name}"
+        if line not in lines:
+            lines.append(line)
+    return "\n".join(lines)
+
+class QueueStatus:
+    """Keeps one chat message up to date with the queue position while a question waits."""
+
+    def __init__(self):
+        self.message = None
+
+    async def update(self, position, eta):
+        wait = f", about {eta:.0f}s" if eta is not None else ""
+        content = f"_Waiting for a free slot: #{position} in line{wait}..._"
+        if self.message is None:
+            self.message = cl.Message(content=content)
+            await self.message.send()
+        else:
+            self.message.content = content
+            await self.message.update()
+
+    async def clear(self):
+        if self.message is not None:
+            await self.message.remove()
+            self.message = None
+
+def load_session_state(chain):
+    """Set memory, topic and retriever boss as saved by whichever worker served the previous
+    turn, a small read (summary + at most MEMORY_MAX_TURNS turns + the topic centroid).
+    Returns False if nothing was saved yet."""
+    state = get_session_store().load(session_key())
+    if state is None:
+        return False
+    chain.retriever.current_boss = state['boss']
+    cl.user_session.set("epoch", state['epoch'])
+    cl.user_session.set("memory", CompactingMemory.from_state(state))
+    cl.user_session.set("topic", TopicTracker.from_bytes(state['topic']))
+    return True
+
+# Conversations (session keys) with a compaction running in this process. The memory object
+# is rebuilt from the store every turn, so its own `compacting` flag doesn't last that long
+_compacting_sessions = set()
+
+def remember(memory, chain, question, answer, topic=None):
+    """Add the turn to the memory and the session store (one appended row), and summarize
+    older turns in the background once there are enough of them."""
+    previous_summary = memory.summary
+    folded = memory.add_turn(question, answer)
+    store = get_session_store()
+    # The epoch of the conversation this memory was loaded from, a clear in between voids the folds
+    epoch = cl.user_session.get("epoch", 0)
+    store.append_turn(session_key(), question, answer, chain.retriever.current_boss,
+                      topic.to_bytes() if topic else None)
+    if folded:
+        store.fold_turns(session_key(), memory.summary, folded, previous_summary, epoch)
+    key = session_key()
+    if memory.needs_compaction() and key not in _compacting_sessions:
+        _compacting_sessions.add(key)
+        asyncio.create_task(compact_memory(memory, key, epoch))
+
+async def compact_memory(memory, key, epoch):
+    """Summarize older turns with the LLM, sharing the admission queue with the questions."""
+    try:
+        async with admission.slot(f"{cl.context.session.id}:memory"):
+            previous_summary = memory.summary
+            folded = await memory.compact(get_shared_resources()['condense_llm'])
+        if folded and not get_session_store().fold_turns(key, memory.summary, folded, previous_summary, epoch):
+            # Another worker changed the conversation meanwhile, its state wins
+            metrics.incr('memory_compactions_discarded')
+    except AdmissionRejected:
+        # Busy: the memory stays bounded anyway and is compacted after a later turn
+        pass
+    except Exception as e:
+        print(f"Memory compaction failed: {e}")
+    finally:
+        _compacting_sessions.discard(key)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Counters, gauges and stage timings in the Prometheus text format."""
+    record_session_memory()
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+def serve_before_catch_all(path):
+    """Chainlit registers a catch-all route serving the UI, move our route in front of it."""
+    routes = app.router.routes
+    route = next(route for route in routes if getattr(route, 'path', None) == path)
+    routes.remove(route)
+    routes.insert(0, route)
+
+serve_before_catch_all("/metrics")
+profiler.mark('main_imported')
+
+def record_session_memory():
+    """Update the RSS gauges, RSS per active session shows what each extra session costs."""
+    rss = metrics.current_rss_bytes()
+    sessions = max(1, metrics.get_gauge('active_sessions'))
+    metrics.set_gauge('process_rss_bytes', rss)
+    metrics.set_gauge('rss_bytes_per_session', rss / sessions)
+
 # Chainlit event handlers
 @cl.on_logout
 def on_logout(request: Request, response: Response):
@@ -104,13 +348,83 @@ def on_logout(request: Request, response: Response):
 def auth():
     return cl.User(identifier="User12345")
 
+def load_answer_cache():
+    """Start with the answers pre-computed by batch_qa.py --warm-cache, if they match the index."""
+    if os.path.exists(ANSWER_CACHE_FILE):
+        answer_cache.load(ANSWER_CACHE_FILE)
+        answer_cache.check_version(get_shared_resources()['index_version'])
+        print(f"Answer cache: {len(answer_cache)} entries loaded from {ANSWER_CACHE_FILE}")
+
+# Set once the index and embedding model are loaded
+_warm = threading.Event()
+
+def warm_up():
+    """Load the shared model, index and LLM client before the first chat needs them."""
+    try:
+        resources = get_shared_resources()
+        profiler.mark('index_loaded')
+        resources['embeddings'].load()
+        profiler.mark('model_loaded')
+        _warm.set()
+        get_ollama_pool().start_health_checks()
+        load_answer_cache()
+        record_session_memory()
+        profiler.mark('warm')
+    except Exception as e:
+        # The first chat retries the loading and shows the error to the user
+        print(f"Warm-up failed: {e}")
+    if profiler.STARTUP_PROFILE:
+        profiler.print_report()
+    profiler.stop()
+
+def load_model_and_index():
+    get_shared_resources()['embeddings'].load()
+    _warm.set()
+
+async def wait_for_warm_up():
+    """Wait for the index and model without blocking the event loop, so the other sessions
+    keep being served, with a loading message in this chat meanwhile."""
+    if _warm.is_set():
+        return
+    loading = cl.Message(content="Loading the model and the boss index, one moment...")
+    await loading.send()
+    try:
+        # Waits on the warm-up thread if it is loading, or loads (again, after a failed warm-up)
+        await asyncio.to_thread(load_model_and_index)
+    finally:
+        await loading.remove()
+
+@cl.on_app_startup
+def on_app_startup():
+    profiler.mark('server_starting')
+    if FAST_START:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        warm_up()
+
+def session_started(start_time):
+    metrics.observe('chat_start_seconds', time.perf_counter() - start_time)
+    metrics.incr('sessions_started')
+    metrics.add_gauge('active_sessions', 1)
+    record_session_memory()
+
+@cl.on_chat_end
+def on_chat_end():
+    metrics.add_gauge('active_sessions', -1)
+    record_session_memory()
+    purge_expired_sessions()
+
 @cl.on_chat_start
 async def start():
     """Initialize chat with welcome message and QA bot."""
+    start_time = time.perf_counter()
     try:
+        await wait_for_warm_up()
         chain = qa_bot()
         cl.user_session.set("chain", chain)
-        cl.user_session.set("memory", ConversationBufferMemory(return_messages=True))
+        cl.user_session.set("memory", CompactingMemory())
+        cl.user_session.set("topic", TopicTracker())
+        session_started(start_time)
 
         welcome_message = cl.Message(content="Hi, Welcome to Chat With Documents using Ollama (Llama3.2:3B) and LangChain. Please keep testing even if Terminal displays errors, since it does not affect the performance in some cases!")
         await welcome_message.send()
@@ -119,45 +433,109 @@ async def start():
 
 @cl.on_chat_resume
 async def on_chat_resume(thread: ThreadDict):
-    """Resume chat and set memory from the previous session."""
+    """Resume chat and set memory from the conversation's state in the session store."""
+    start_time = time.perf_counter()
     try:
+        await wait_for_warm_up()
         chain = qa_bot()
-        memory = ConversationBufferMemory(return_messages=True)
-        root_messages = [m for m in thread["steps"] if m["parentId"] is None]
-        
-        for message in root_messages:
-            if message["type"] == "user_message":
-                memory.chat_memory.add_user_message(message["output"])
-            else:
-                memory.chat_memory.add_ai_message(message["output"])
-        
-        cl.user_session.set("memory", memory)
+        if not load_session_state(chain):
+            # Threads from before the session store: take only their newest turns and seed it
+            memory = CompactingMemory.from_thread_steps(thread["steps"])
+            cl.user_session.set("epoch", get_session_store().save_state(session_key(), memory.state()))
+            cl.user_session.set("memory", memory)
+            cl.user_session.set("topic", TopicTracker())
         cl.user_session.set("chain", chain)
+        session_started(start_time)
     except Exception as e:
         await cl.Message(content=f"Error resuming chat: {e}").send()
 
 @cl.on_message
 async def on_message(message):
-    """Handle incoming user messages and respond with answers."""
+    """Handle incoming user messages and respond with answers, traced as one request."""
+    with tracing.request_trace(session=cl.context.session.id, message=message.id):
+        await answer_message(message)
+
+async def answer_message(message):
+    from utils.streaming import MessageStreamHandler
+
+    start_time = time.perf_counter()
     chain = cl.user_session.get("chain")
-    memory = cl.user_session.get("memory")
 
     if not chain:
         await cl.Message(content="Bot initialization failed. Please restart the chat.").send()
         return
 
-    reset_memory_if_topic_changes(message.content, memory)
+    # The previous turn may have been served by another worker
+    load_session_state(chain)
+    memory = cl.user_session.get("memory")
+    topic = cl.user_session.get("topic")
 
     try:
-        inputs = {"question": message.content, "chat_history": memory.chat_memory.messages}
-        res = await chain.acall(inputs)
+        question_vector = embed_question(message.content)
+        if reset_memory_if_topic_changes(question_vector, memory, topic):
+            # A new topic shouldn't keep searching the previous boss
+            chain.retriever.reset()
+            cl.user_session.set("epoch", get_session_store().clear(session_key()))
+
+        # Direct stat lookups ("Skeletron Prime max life in Master mode") are answered from
+        # the stats table in milliseconds, anything that needs reasoning goes to the LLM
+        with tracing.span('stat_lookup'):
+            stat_answer = answer_stat_question(message.content, get_shared_resources()['stats'])
+        if stat_answer:
+            metrics.incr('stat_fast_path_hits')
+            tracing.annotate(path='stats')
+            await cl.Message(content=f"{stat_answer}\n\n_(from the stats table)_").send()
+            remember(memory, chain, message.content, stat_answer, topic)
+            return
+
+        # Only questions asked without history can be answered from the cache, a follow-up
+        # depends on the conversation and always goes through the chain
+        cacheable = not memory.messages
+        if cacheable:
+            answer_cache.check_version(get_shared_resources()['index_version'])
+            cached = answer_cache.lookup(question_vector)
+            if cached:
+                tracing.annotate(path='cache')
+                answer = cached['answer']
+                await cl.Message(content=f"{answer}\n\n_(cached answer)_").send()
+                remember(memory, chain, message.content, answer, topic)
+                return
+
+        # The answer is streamed into this message token by token while the chain runs
+        response = cl.Message(content="")
+        stream_handler = MessageStreamHandler(response, start_time)
+        inputs = {"question": message.content, "chat_history": memory.messages}
+        queue_status = QueueStatus()
+        tracing.annotate(path='llm')
+        try:
+            async with admission.slot(cl.context.session.id, queue_status.update):
+                await queue_status.clear()
+                res = await chain.acall(inputs, callbacks=[stream_handler])
+        except AdmissionRejected as e:
+            tracing.annotate(path='rejected')
+            await queue_status.clear()
+            await cl.Message(content=str(e)).send()
+            return
+        tracing.annotate(**{f"{name}_tokens": count for name, count in res.get('token_counts', {}).items()
+                            if name in ('prompt', 'history', 'context', 'answer')})
         answer = res.get("answer", "No answer found")
-        if not res.get("source_documents"):
+        if not stream_handler.tokens:
+            # Nothing was streamed (e.g. an LLM without token callbacks), send it whole
+            response.content = answer
+        if res.get("source_documents"):
+            await response.stream_token(f"\n\nSources:\n{format_sources(res['source_documents'])}")
+        else:
             answer += "\nNo Sources Found."
+            await response.stream_token("\nNo Sources Found.")
+        await response.send()
+        metrics.observe('answer_total_seconds', time.perf_counter() - start_time)
 
-        await cl.Message(content=answer).send()
+        if cacheable:
+            sources = [doc.metadata.get('source') for doc in res.get("source_documents", [])]
+            answer_cache.store(message.content, question_vector, answer, sources)
 
-        memory.chat_memory.add_user_message(message.content)
-        memory.chat_memory.add_ai_message(answer)
+        remember(memory, chain, message.content, answer, topic)
     except Exception as e:
+        metrics.incr('errors{stage="message"}')
+        tracing.annotate(error=str(e))
         await cl.Message(content=f"Error during processing: {e}").send()
@@ -0,0 +1,148 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from utils import metrics
+
+# Generations allowed to run against the LLM backend at the same time
+LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", "2"))
+# Requests allowed to wait for a slot (all users), and per user
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+LLM_MAX_QUEUED_PER_USER = int(os.environ.get("LLM_MAX_QUEUED_PER_USER", "2"))
+# A request still waiting after this many seconds is rejected
+LLM_QUEUE_DEADLINE = float(os.environ.get("LLM_QUEUE_DEADLINE", "120"))
+# How often a waiting request gets its queue position refreshed
+QUEUE_UPDATE_INTERVAL = 2.0
+
+class AdmissionRejected(Exception):
+    """The request was not admitted: queue full, too many queued for this user, or deadline passed."""
+
+class _Waiter:
+    def __init__(self, user):
+        self.user = user
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.perf_counter()
+
+class AdmissionController:
+    """Concurrency limiter with a bounded wait queue in front of the LLM.
+
+    Waiting requests are queued per user and slots are handed out round robin between
+    users, so one user sending many messages cannot starve the others. Meant to be used
+    from a single event loop (Chainlit's), so no locking is needed.
+    """
+
+    def __init__(self, max_concurrent=LLM_MAX_CONCURRENT, max_queue=LLM_MAX_QUEUE,
+                 max_per_user=LLM_MAX_QUEUED_PER_USER, deadline=LLM_QUEUE_DEADLINE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.deadline = deadline
+        self.active = 0
+        self.queues = OrderedDict()
+        # Moving average of how long a generation holds its slot, for the wait estimate
+        self.avg_service_seconds = None
+
+    @property
+    def waiting(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _order(self):
+        """Waiters in the order they will be admitted (round robin over users)."""
+        queues = [list(queue) for queue in self.queues.values()]
+        order = []
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+        return order
+
+    def position(self, waiter):
+        """1-based queue position and estimated wait in seconds (None before any generation finished)."""
+        position = self._order().index(waiter) + 1
+        if self.avg_service_seconds is None:
+            return position, None
+        return position, math.ceil(position / self.max_concurrent) * self.avg_service_seconds
+
+    def _update_gauges(self):
+        metrics.set_gauge('llm_queue_depth', self.waiting)
+        metrics.set_gauge('llm_active_generations', self.active)
+
+    def _remove(self, waiter):
+        queue = self.queues.get(waiter.user)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.user]
+
+    def _dispatch(self):
+        while self.active < self.max_concurrent and self.queues:
+            # Take the first user's oldest request, then move that user to the back
+            user, queue = next(iter(self.queues.items()))
+            waiter = queue.popleft()
+            del self.queues[user]
+            if queue:
+                self.queues[user] = queue
+            if not waiter.future.done():
+                waiter.future.set_result(True)
+                self.active += 1
+        self._update_gauges()
+
+    async def acquire(self, user, on_wait=None):
+        """Wait for a generation slot; `on_wait(position, eta_seconds)` is awaited while queued."""
+        if self.active < self.max_concurrent and not self.queues:
+            self.active += 1
+            metrics.observe('llm_queue_wait_seconds', 0.0)
+            self._update_gauges()
+            return
+        if self.waiting >= self.max_queue:
+            metrics.incr('admission_rejected_queue_full')
+            raise AdmissionRejected("The server is busy, please try again in a moment.")
+        if len(self.queues.get(user, ())) >= self.max_per_user:
+            metrics.incr('admission_rejected_per_user')
+            raise AdmissionRejected("Please wait for your previous questions to be answered first.")
+
+        waiter = _Waiter(user)
+        self.queues.setdefault(user, deque()).append(waiter)
+        self._update_gauges()
+        try:
+            while not waiter.future.done():
+                remaining = self.deadline - (time.perf_counter() - waiter.enqueued)
+                if remaining <= 0:
+                    self._remove(waiter)
+                    metrics.incr('admission_rejected_deadline')
+                    raise AdmissionRejected("The server is too busy to answer right now, please try again later.")
+                if on_wait is not None:
+                    await on_wait(*self.position(waiter))
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), min(remaining, QUEUE_UPDATE_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted while we were giving up, hand it to the next waiter
+                self.release()
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            self._update_gauges()
+            raise
+        metrics.observe('llm_queue_wait_seconds', time.perf_counter() - waiter.enqueued)
+
+    def release(self, service_seconds=None):
+        self.active -= 1
+        if service_seconds is not None:
+            if self.avg_service_seconds is None:
+                self.avg_service_seconds = service_seconds
+            else:
+                self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * service_seconds
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user, on_wait=None):
+        await self.acquire(user, on_wait)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
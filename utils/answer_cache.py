@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import metrics
+
+# A new question reuses a cached answer when its embedding is at least this similar
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+# Entries expire after this many seconds, and the least recently used go first when full
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+# Saved by batch_qa.py --warm-cache, loaded by main.py at startup
+ANSWER_CACHE_FILE = os.environ.get("ANSWER_CACHE_FILE", "cache/answer_cache.json")
+
+class SemanticAnswerCache:
+    """Answer cache keyed by question embedding, with TTL + LRU eviction.
+
+    Entries belong to one version of the vector index; when the version changes the
+    cache is emptied, so answers never outlive the documents they came from.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def check_version(self, version):
+        """Drop every entry if the index version changed since the entries were stored."""
+        with self._lock:
+            if version != self.version:
+                if self._entries:
+                    metrics.incr('answer_cache_invalidations')
+                self._entries.clear()
+                self.version = version
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry['created'] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, vector):
+        """Return the cached entry closest to `vector` if it clears the threshold, else None."""
+        query = _normalize(vector)
+        with self._lock:
+            self._expire(time.time())
+            best_key, best_score = None, -1.0
+            if self._entries:
+                keys = list(self._entries)
+                scores = np.stack([self._entries[key]['vector'] for key in keys]) @ query
+                index = int(np.argmax(scores))
+                best_key, best_score = keys[index], float(scores[index])
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                metrics.incr('answer_cache_hits')
+                return dict(self._entries[best_key], score=best_score)
+        metrics.incr('answer_cache_misses')
+        return None
+
+    def store(self, question, vector, answer, sources=None):
+        with self._lock:
+            self._entries[self._next_id] = {
+                'question': question,
+                'vector': _normalize(vector),
+                'answer': answer,
+                'sources': sources or [],
+                'created': time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            metrics.set_gauge('answer_cache_entries', len(self._entries))
+
+    def save(self, path=ANSWER_CACHE_FILE):
+        """Write the entries (oldest first) with the index version they belong to."""
+        with self._lock:
+            data = {'version': self.version,
+                    'entries': [dict(entry, vector=entry['vector'].tolist()) for entry in self._entries.values()]}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+
+    def load(self, path=ANSWER_CACHE_FILE):
+        """Replace the entries with the ones saved at path; expired ones are dropped. Call
+        check_version afterwards so entries of an older index are dropped too."""
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        with self._lock:
+            self._entries.clear()
+            self.version = data.get('version')
+            for entry in data.get('entries', [])[-self.max_entries:]:
+                self._entries[self._next_id] = dict(entry, vector=np.asarray(entry['vector'], dtype=np.float32))
+                self._next_id += 1
+            self._expire(time.time())
+            metrics.set_gauge('answer_cache_entries', len(self._entries))
+        return len(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+_index_versions = {}
+
+def index_version(db_path, manifest_name="manifest.json"):
+    """Version of the index saved at db_path, as written by ingest.py into its manifest.
+
+    The manifest is only re-read when its modification time changes.
+    """
+    manifest_path = os.path.join(db_path, manifest_name)
+    try:
+        stamp = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _index_versions.get(manifest_path)
+    if cached is None or cached[0] != stamp:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            cached = (stamp, json.load(file).get('version'))
+        _index_versions[manifest_path] = cached
+    return cached[1]
@@ -0,0 +1,82 @@
+import json
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how',
+    'i', 'in', 'is', 'it', 'its', 'of', 'on', 'or', 'the', 'this', 'to', 'was', 'what', 'when',
+    'where', 'which', 'who', 'why', 'will', 'with', 'you',
+}
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords, plus adjacent-word bigrams so multi-word
+    names such as "Mechanical Skull" score as a unit."""
+    words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of chunk ids, saved as compact JSON next to the FAISS index."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = []
+        self.doc_lengths = []
+        self.postings = {}
+        self.avg_length = 0.0
+
+    @classmethod
+    def build(cls, doc_ids, texts, **params):
+        index = cls(**params)
+        for doc_index, (doc_id, text) in enumerate(zip(doc_ids, texts)):
+            counts = Counter(tokenize(text))
+            index.doc_ids.append(doc_id)
+            index.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                index.postings.setdefault(term, []).append([doc_index, tf])
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.doc_lengths else 0.0
+        return index
+
+    def search(self, query, k=4, allowed=None):
+        """Return up to k (doc_id, score) pairs, restricted to the ids in `allowed` if given."""
+        n = len(self.doc_ids)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_index] / (self.avg_length or 1))
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for doc_index, score in ranked:
+            doc_id = self.doc_ids[doc_index]
+            if allowed is None or doc_id in allowed:
+                results.append((doc_id, score))
+                if len(results) == k:
+                    break
+        return results
+
+    def save(self, path):
+        data = {
+            'k1': self.k1, 'b': self.b, 'doc_ids': self.doc_ids,
+            'doc_lengths': self.doc_lengths, 'postings': self.postings,
+        }
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        index = cls(data['k1'], data['b'])
+        index.doc_ids = data['doc_ids']
+        index.doc_lengths = data['doc_lengths']
+        index.postings = data['postings']
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.doc_lengths else 0.0
+        return index
@@ -1,8 +1,8 @@
-from bs4 import BeautifulSoup
-import requests
+from utils.boss_stats_utils import parse_html
+from utils.http_fetch import fetch
 
 def extract_intro(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
 
     # Extract flavor text
     flavor_text_element = soup.find('div', class_='flavor-text')
@@ -44,21 +44,21 @@ def extract_intro(html):
 
 def fetch_info(url):
 
-    # Make a GET request to fetch the HTML content
-    response = requests.get(url)
+    # Fetch the HTML content through the shared session and response cache
+    html = fetch(url)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Parse the HTML content with BeautifulSoup
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract the relevant information
-        content = soup.find('div', class_='mw-parser-output')
+    return extract_info(html)
+
+def extract_info(html):
+    soup = parse_html(html)
+
+    # Extract the relevant information
+    content = soup.find('div', class_='mw-parser-output')
 
-        # Convert the content to text format
-        info = content.get_text(separator=' ')
+    # Convert the content to text format
+    info = content.get_text(separator=' ')
 
-        return info
+    return info
 
 import json
 import re
@@ -1,11 +1,23 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Tag
 import json
 import re
+
+def parse_html(html):
+    # Parse the page once; an already parsed tree (or any Tag inside it) is returned as-is
+    # so every extractor below can share the same tree instead of re-parsing the string
+    if isinstance(html, Tag):
+        return html
+    return BeautifulSoup(html, 'html.parser')
+
 def extract_forms(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    # Keep the string based output for existing callers
+    return {form: str(form_content) for form, form_content in extract_form_tags(html).items()}
+
+def extract_form_tags(html):
+    soup = parse_html(html)
     
-    # Dictionary to hold the form HTML content
+    # Dictionary to hold the form infobox tags
     form_dict = {}
     
     # Find all 'title' divs
@@ -27,7 +39,7 @@ def extract_forms(html):
                 
                 # Extract the entire 'infobox' div containing the form details
             form_content = title.find_parent('div', class_='infobox')
-            form_dict[last_title] = str(form_content)
+            form_dict[last_title] = form_content
         
         # Update last_title to be the current title for the next iteration
         last_title = current_title
@@ -36,8 +48,8 @@ def extract_forms(html):
 
 def get_stat(statContent, form_key):
 
-    # Parse the HTML content
-    soup = BeautifulSoup(statContent, 'html.parser')
+    # Parse the HTML content once and share the tree with the extractors below
+    soup = parse_html(statContent)
 
     # Create a dictionary to store the extracted information
     data = {}
@@ -69,20 +81,20 @@ def get_stat(statContent, form_key):
                 # Add the result to the dictionary, handling empty extracted_data cases
                 data[header] = extracted_data if len(extracted_data) > 1 else (extracted_data[0] if extracted_data else '')
 
-    data['Type'] = extract_type(statContent)
+    data['Type'] = extract_type(soup)
 
-    data['Environment'] = extract_environment(statContent)
+    data['Environment'] = extract_environment(soup)
 
-    damage_dict = extract_damage(statContent)
+    damage_dict = extract_damage(soup)
     if not damage_dict:
         damage_dict = 'Varies per attack'
     data['Damage'] = damage_dict
 
-    data['Max Life'] = extract_max_life(statContent)
-    data['Defense'] = extract_defense(statContent)
+    data['Max Life'] = extract_max_life(soup)
+    data['Defense'] = extract_defense(soup)
 
-    data['Immune to'] = extract_immunity_info(statContent)
-    data['Knockback resist'] = extract_KBR(statContent)
+    data['Immune to'] = extract_immunity_info(soup)
+    data['Knockback resist'] = extract_KBR(soup)
     if data.get('Coins'):  # This will safely check if 'Coins' exists and is not None or empty
         data['Coins'] = coin_splitter(data['Coins'])
         coin_lst = data['Coins'].split(' , ')
@@ -110,7 +122,7 @@ def extract_audio(data_dict):
     return audio
 
 def extract_type(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
     
     # List to store type values
     type_data = []
@@ -138,10 +150,8 @@ def extract_type(html):
     # Return the type data as a list or empty list if none found
     return type_data if type_data else None
 
-from bs4 import BeautifulSoup
-
 def extract_loot_items(html, class_tag):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
     loot_items = soup.find_all('li', class_=class_tag) if soup else []
     
     extracted_items = []
@@ -169,7 +179,7 @@ def combine_loot(loot_sources):
     return loot_list
 
 def extract_environment(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
     environment_data = []
     
     environment_row = soup.find('a', title='Environment') if soup else None
@@ -182,7 +192,7 @@ def extract_environment(html):
     return environment_data if environment_data else None
 
 def extract_damage(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
     damage_data = {}
     
     damage_row = soup.find('th', string="Damage") if soup else None
@@ -213,7 +223,7 @@ def extract_damage(html):
     return damage_data if damage_data else '(Varies per attack)'
 
 def extract_max_life(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
     max_life_data = {}
     
     max_life_row = soup.find('th', string="Max Life") if soup else None
@@ -231,7 +241,7 @@ def extract_max_life(html):
     return max_life_data if max_life_data else None
 
 def extract_defense(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
     defense_data = {'Base':'N/A','Increased Defense':'N/A'}
 
     defense_row = soup.find('th', string=lambda text: text and 'Defense' in text) if soup else None
@@ -262,7 +272,7 @@ def extract_defense(html):
     return defense_data if defense_data else None
 
 def extract_KBR(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
 
     # Find all rows containing knockback resist data
     kb_resist_rows = soup.find_all('tr')
@@ -296,7 +306,7 @@ def extract_KBR(html):
     return kb_resist_dict
 
 def extract_immunity_info(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_html(html)
 
     # Try to find the td with class 'immunities' first
     immunities_td = soup.find('td', class_='immunities')
@@ -438,3 +448,52 @@ def remove_square_brackets(text):
     # Use regex to replace [number] patterns with an empty string
     cleaned_text = re.sub(r'\[\d+\]', '', text)
     return cleaned_text
+
+def _stat_number(value):
+    # "28000" -> 28000.0, "1,200" -> 1200.0, anything else (percentages, coins, text) -> None
+    match = re.fullmatch(r'\s*(\d[\d,]*(?:\.\d+)?)\s*', str(value))
+    return float(match.group(1).replace(',', '')) if match else None
+
+def stat_rows(boss_name, stat_data):
+    """Flatten one get_stat() dict into typed rows (boss, form, stat, mode, attack, value, number)."""
+    form = stat_data.get('Title', boss_name)
+    rows = []
+
+    def add(stat, mode, value, attack=None):
+        rows.append({'boss': boss_name, 'form': form, 'stat': stat, 'mode': mode, 'attack': attack,
+                     'value': remove_square_brackets(str(value)), 'number': _stat_number(value)})
+
+    for mode, value in (stat_data.get('Max Life') or {}).items():
+        add('max_life', mode, value)
+
+    defense = stat_data.get('Defense') or {}
+    base = defense.get('Base', 'N/A')
+    if isinstance(base, dict):
+        for mode, value in base.items():
+            add('defense', mode, value)
+    elif base != 'N/A':
+        add('defense', 'All', base)
+    if defense.get('Increased Defense', 'N/A') != 'N/A':
+        add('defense_increased', 'All', defense['Increased Defense'])
+
+    damage = stat_data.get('Damage')
+    if isinstance(damage, dict):
+        for attack, values in damage.items():
+            for mode, value in values:
+                add('damage', mode, value, attack.strip('()') if attack else None)
+    elif damage:
+        add('damage', 'All', damage.strip('()'))
+
+    for mode, value in (stat_data.get('Knockback resist') or {}).items():
+        add('knockback_resist', mode, value)
+
+    coins = stat_data.get('Coins')
+    if isinstance(coins, dict):
+        for mode, value in coins.items():
+            add('coins', mode, value)
+
+    immunities = stat_data.get('Immune to')
+    if immunities:
+        add('immune_to', 'All', ', '.join(immunities))
+
+    return rows
@@ -0,0 +1,89 @@
+import json
+import mmap
+import os
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+# On-disk layout of a saved vector store folder
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docstore.jsonl"
+OFFSETS_FILE = "docstore.offsets.npy"
+IDS_FILE = "docstore.ids.json"
+
+class CompactDocstore(Docstore):
+    """Read-only docstore over a JSONL file of chunks, one line per index position.
+
+    The file is memory-mapped and a chunk is decoded only when it is looked up, through
+    the byte offsets array (also memory-mapped), so every process serving the same folder
+    shares the same page cache and nothing is unpickled.
+    """
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, IDS_FILE), 'r', encoding='utf-8') as file:
+            self.ids = json.load(file)
+        self._positions = {doc_id: position for position, doc_id in enumerate(self.ids)}
+        self._offsets = np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode='r')
+        with open(os.path.join(folder, DOCS_FILE), 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def document_at(self, position):
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._data[start:end])
+        return Document(id=record['id'], page_content=record['page_content'], metadata=record['metadata'])
+
+    def search(self, search):
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.document_at(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+def save_compact_store(db, folder):
+    """Write a LangChain FAISS store as index.faiss + JSONL docstore with offsets (no pickle)."""
+    import faiss
+
+    os.makedirs(folder, exist_ok=True)
+    faiss.write_index(db.index, os.path.join(folder, INDEX_FILE))
+    ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+    offsets = [0]
+    with open(os.path.join(folder, DOCS_FILE), 'wb') as file:
+        for doc_id in ids:
+            doc = db.docstore.search(doc_id)
+            line = json.dumps({'id': doc_id, 'page_content': doc.page_content, 'metadata': doc.metadata},
+                              ensure_ascii=False).encode('utf-8') + b"\n"
+            file.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(folder, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(folder, IDS_FILE), 'w', encoding='utf-8') as file:
+        json.dump(ids, file)
+
+def compact_store_exists(folder):
+    return all(os.path.exists(os.path.join(folder, name)) for name in (INDEX_FILE, DOCS_FILE, OFFSETS_FILE, IDS_FILE))
+
+def load_compact_store(folder, embeddings, mmap_index=True):
+    """Load a folder written by save_compact_store as a LangChain FAISS store.
+
+    With mmap_index the FAISS index is memory-mapped read-only and the docstore stays on
+    disk, for serving. Without it, index and chunks are read into memory so the store
+    can be modified (incremental ingest).
+
+    IO_FLAG_MMAP alone only maps IVF inverted lists, flat codes (IndexFlat, the HNSW
+    storage, PQ codes) would still be copied into each process; IO_FLAG_MMAP_IFC maps the
+    whole file, so the vectors of every index type stay in the shared page cache.
+    """
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap_index else 0
+    index = faiss.read_index(os.path.join(folder, INDEX_FILE), flags)
+    docstore = CompactDocstore(folder)
+    ids = docstore.ids
+    if not mmap_index:
+        docstore = InMemoryDocstore({doc_id: docstore.document_at(position) for position, doc_id in enumerate(ids)})
+    return FAISS(embeddings, index, docstore, dict(enumerate(ids)))
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized inside this process
+    fcntl = None
+
+EMBEDDING_CACHE_DIR = "cache/embeddings"
+# Upper bound for the in-memory LRU in front of the on-disk store
+EMBEDDING_CACHE_MEMORY_MB = float(os.environ.get("EMBEDDING_CACHE_MEMORY_MB", "32"))
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches vectors by model name + text hash.
+
+    Document vectors are appended to a raw float32 file that is read back through np.memmap,
+    with a size-bounded LRU in front of it. Query vectors only go to the LRU: every chat
+    question is a new text, so persisting them would grow the disk store (and the key index
+    read at startup) without bound. Only texts that were never seen before reach the wrapped
+    model, and they are encoded in one batch.
+    """
+
+    def __init__(self, underlying, model_name=None, cache_dir=EMBEDDING_CACHE_DIR, max_memory_mb=EMBEDDING_CACHE_MEMORY_MB):
+        # `underlying` may also be a zero-argument factory, the model is then only loaded
+        # the first time a text misses the cache
+        self._underlying = underlying
+        self.model_name = model_name or getattr(underlying, 'model_name', type(underlying).__name__)
+        namespace = hashlib.sha1(self.model_name.encode('utf-8')).hexdigest()[:12]
+        self.cache_dir = os.path.join(cache_dir, namespace)
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._lru_bytes = 0
+        self._rows = {}
+        self._dim = None
+        self._mmap = None
+        self._load_index()
+
+    @property
+    def underlying(self):
+        if callable(self._underlying) and not isinstance(self._underlying, Embeddings):
+            with self._lock:
+                if callable(self._underlying) and not isinstance(self._underlying, Embeddings):
+                    with metrics.timed('embedding_model_load_seconds'):
+                        self._underlying = self._underlying()
+        return self._underlying
+
+    def load(self):
+        """Load the wrapped model now instead of on the first cache miss."""
+        return self.underlying
+
+    # Disk store: vectors.f32 holds the rows, keys.txt maps "<key> <row>" per line
+    def _paths(self):
+        return (os.path.join(self.cache_dir, "vectors.f32"),
+                os.path.join(self.cache_dir, "keys.txt"),
+                os.path.join(self.cache_dir, "dim"))
+
+    def _load_index(self):
+        vectors_path, keys_path, dim_path = self._paths()
+        if not os.path.exists(dim_path):
+            return
+        with open(dim_path, 'r') as file:
+            self._dim = int(file.read())
+        with open(keys_path, 'r') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 2:
+                    self._rows[parts[0]] = int(parts[1])
+
+    def _read_row(self, row):
+        vectors_path, _, _ = self._paths()
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            rows = os.path.getsize(vectors_path) // (self._dim * 4)
+            self._mmap = np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(rows, self._dim))
+        return self._mmap[row].tolist()
+
+    def _append(self, items):
+        vectors_path, keys_path, dim_path = self._paths()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self._dim is None:
+            self._dim = len(items[0][1])
+            with open(dim_path, 'w') as file:
+                file.write(str(self._dim))
+
+        with open(keys_path, 'a') as keys_file, open(vectors_path, 'ab') as vectors_file:
+            if fcntl is not None:
+                fcntl.flock(keys_file, fcntl.LOCK_EX)
+            try:
+                # Rows are derived from the file size so concurrent writers never collide
+                row = vectors_file.seek(0, os.SEEK_END) // (self._dim * 4)
+                vectors_file.write(np.asarray([vector for _, vector in items], dtype=np.float32).tobytes())
+                vectors_file.flush()
+                lines = []
+                for key, _ in items:
+                    self._rows[key] = row
+                    lines.append(f"{key} {row}\n")
+                    row += 1
+                keys_file.write(''.join(lines))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    def _remember(self, key, vector):
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return
+        self._lru[key] = vector
+        self._lru_bytes += len(vector) * 4
+        while self._lru_bytes > self.max_memory_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._lru_bytes -= len(evicted) * 4
+
+    def _lookup(self, key):
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            return vector
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        vector = self._read_row(row)
+        self._remember(key, vector)
+        return vector
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{kind}\0{text}".encode('utf-8')).hexdigest()
+
+    def _embed(self, kind, texts, compute, persist=True):
+        keys = [self._key(kind, text) for text in texts]
+        with self._lock:
+            found = {key: self._lookup(key) for key in set(keys)}
+            missing = {key: text for key, text in zip(keys, texts) if found[key] is None}
+            hits = len(texts) - sum(1 for key in keys if key in missing)
+            # Several threads embed at once (sessions, ingest workers), count under the lock
+            self.hits += hits
+            self.misses += len(missing)
+        metrics.incr('embedding_cache_hits', hits)
+        metrics.incr('embedding_cache_misses', len(missing))
+
+        if missing:
+            # Round through float32 so fresh and cached vectors are bit-identical
+            with metrics.timed('embedding_encode_seconds'):
+                vectors = np.asarray(compute(list(missing.values())), dtype=np.float32).tolist()
+            new_items = list(zip(missing.keys(), vectors))
+            with self._lock:
+                if persist:
+                    self._append(new_items)
+                for key, vector in new_items:
+                    found[key] = vector
+                    self._remember(key, vector)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed('doc', texts, lambda missing: self.underlying.embed_documents(missing))
+
+    def embed_query(self, text):
+        return self._embed('query', [text], lambda missing: [self.underlying.embed_query(missing[0])],
+                           persist=False)[0]
+
+    def stats(self):
+        """Hit/miss counters and cache sizes."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            sizes = {'memory_entries': len(self._lru), 'memory_bytes': self._lru_bytes, 'disk_entries': len(self._rows)}
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 3) if total else None, **sizes}
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def get_embeddings(model_name='sentence-transformers/all-MiniLM-L6-v2', device='cpu'):
+    """Process-wide embeddings instance per (model, device), shared by retrieval and topic detection."""
+    with _shared_lock:
+        embeddings = _shared.get((model_name, device))
+        if embeddings is None:
+            embeddings = _shared[(model_name, device)] = cached_embeddings(model_name=model_name, device=device)
+    return embeddings
+
+def set_embeddings(embeddings, model_name='sentence-transformers/all-MiniLM-L6-v2', device='cpu'):
+    """Make get_embeddings return `embeddings` for this model, e.g. fake embeddings in benchmarks."""
+    with _shared_lock:
+        _shared[(model_name, device)] = embeddings
+
+def cached_embeddings(model_name='sentence-transformers/all-MiniLM-L6-v2', device='cpu', cache_dir=EMBEDDING_CACHE_DIR):
+    """HuggingFace embeddings behind the persistent cache, the model (and torch) is loaded lazily."""
+
+    def load_model():
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device})
+
+    return CachedEmbeddings(load_model, model_name=model_name, cache_dir=cache_dir)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+# On-disk response cache, one metadata file and one body file per URL
+CACHE_DIR = "cache/http"
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 30)
+# Cached pages younger than this many seconds are served without touching the network
+CACHE_MAX_AGE = int(os.environ.get("SCRAPER_CACHE_MAX_AGE", "0"))
+# Replay mode: only serve pages from the cache, never go to the network
+OFFLINE = os.environ.get("SCRAPER_OFFLINE", "0") == "1"
+HEADERS = {'User-Agent': 'Terraria-ChatBot/1.0 (wiki scraper)'}
+# Politeness limit per host (requests per second, 0 disables it) and the burst it allows
+HOST_RATE = float(os.environ.get("SCRAPER_RATE", "2"))
+HOST_BURST = int(os.environ.get("SCRAPER_BURST", "2"))
+# Transient failures (connection errors, 429 and 5xx) are retried with exponential backoff
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Counters for the scrape report: network downloads, 304 revalidations and pure cache hits
+fetch_stats = {'downloaded': 0, 'not_modified': 0, 'cached': 0, 'retries': 0}
+
+_session = None
+_lock = threading.Lock()
+_host_buckets = {}
+
+class TokenBucket:
+    """Thread-safe token bucket: refills `rate` tokens per second and holds at most `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def set_host_rate(rate, burst=None):
+    """Change the per-host request rate used by fetch() (0 disables rate limiting)."""
+    global HOST_RATE, HOST_BURST
+    with _lock:
+        HOST_RATE = rate
+        if burst is not None:
+            HOST_BURST = burst
+        _host_buckets.clear()
+
+def _wait_for_host(url):
+    if HOST_RATE <= 0:
+        return
+    host = urlparse(url).netloc
+    with _lock:
+        bucket = _host_buckets.get(host)
+        if bucket is None:
+            bucket = _host_buckets[host] = TokenBucket(HOST_RATE, HOST_BURST)
+    bucket.acquire()
+
+def _get_with_retries(url, headers, timeout):
+    for attempt in range(RETRIES + 1):
+        _wait_for_host(url)
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == RETRIES:
+                raise
+            delay = BACKOFF * 2 ** attempt
+        else:
+            if response.status_code not in RETRY_STATUS or attempt == RETRIES:
+                return response
+            retry_after = response.headers.get('Retry-After', '')
+            delay = float(retry_after) if retry_after.isdigit() else BACKOFF * 2 ** attempt
+        _count('retries')
+        time.sleep(delay)
+
+def get_session(pool_size=10):
+    """Return the process-wide pooled session (keep-alive connections are reused)."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(HEADERS)
+            _session = session
+    return _session
+
+def _count(key):
+    with _lock:
+        fetch_stats[key] += 1
+
+def _cache_paths(url, cache_dir):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json"), os.path.join(cache_dir, f"{key}.html")
+
+def load_cached(url, cache_dir=None):
+    """Return (metadata, text) for a cached URL, or None if it was never stored."""
+    cache_dir = cache_dir or CACHE_DIR
+    meta_path, body_path = _cache_paths(url, cache_dir)
+    if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as file:
+        meta = json.load(file)
+    with open(body_path, 'r', encoding='utf-8') as file:
+        text = file.read()
+    return meta, text
+
+def _write_atomic(path, content):
+    tmp_path = f"{path}.tmp{threading.get_ident()}"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+def store_cached(url, text, etag=None, last_modified=None, cache_dir=None):
+    """Store a response body and its validators on disk."""
+    cache_dir = cache_dir or CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path, body_path = _cache_paths(url, cache_dir)
+    meta = {'url': url, 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()}
+    # Body first, so a metadata file always points at a complete body
+    _write_atomic(body_path, text)
+    _write_atomic(meta_path, json.dumps(meta))
+
+def touch_cached(url, meta, cache_dir=None):
+    cache_dir = cache_dir or CACHE_DIR
+    meta_path, _ = _cache_paths(url, cache_dir)
+    meta['fetched_at'] = time.time()
+    _write_atomic(meta_path, json.dumps(meta))
+
+def fetch(url, cache_dir=None, offline=None, max_age=None, timeout=TIMEOUT):
+    """Fetch a page through the shared session and the on-disk cache.
+
+    Cached pages are revalidated with If-None-Match/If-Modified-Since, so an unchanged
+    page costs a 304. Requests are rate limited per host and transient failures are
+    retried with backoff. In offline mode only the cache is used.
+    """
+    offline = OFFLINE if offline is None else offline
+    max_age = CACHE_MAX_AGE if max_age is None else max_age
+    cached = load_cached(url, cache_dir)
+
+    if offline:
+        if cached is None:
+            raise Exception(f"Offline mode: no cached copy of {url}")
+        _count('cached')
+        return cached[1]
+
+    headers = {}
+    if cached is not None:
+        meta, text = cached
+        if max_age and time.time() - meta.get('fetched_at', 0) < max_age:
+            _count('cached')
+            return text
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    response = _get_with_retries(url, headers, timeout)
+
+    if response.status_code == 304 and cached is not None:
+        touch_cached(url, cached[0], cache_dir)
+        _count('not_modified')
+        return cached[1]
+
+    if response.status_code != 200:
+        raise Exception(f"Error fetching page: {response.status_code}")
+
+    store_cached(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'), cache_dir)
+    _count('downloaded')
+    return response.text
@@ -0,0 +1,141 @@
+import os
+import re
+from collections import deque
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils import metrics
+
+# Turns kept word for word; older turns are folded into the rolling summary
+MEMORY_RECENT_TURNS = int(os.environ.get("MEMORY_RECENT_TURNS", "3"))
+# Older turns are summarized in batches of this many, one LLM call per batch
+MEMORY_COMPACT_BATCH = int(os.environ.get("MEMORY_COMPACT_BATCH", "3"))
+# Hard bound: if summarizing falls behind, the oldest turns beyond this are dropped
+MEMORY_MAX_TURNS = int(os.environ.get("MEMORY_MAX_TURNS", "8"))
+# The summary never grows past this many characters
+SUMMARY_MAX_CHARS = int(os.environ.get("MEMORY_SUMMARY_MAX_CHARS", "1200"))
+
+SUMMARY_PROMPT = """Update the summary of a conversation about Terraria bosses with the new turns.
+Keep boss names, stats and decisions the user cares about. Answer with the new summary only, at most 5 sentences.
+
+Current summary: {summary}
+
+New turns:
+{turns}
+
+New summary:"""
+
+def _first_sentence(text, limit=200):
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence[:limit]
+
+def extractive_summary(summary, turns):
+    """Summary without an LLM: each question with the first sentence of its answer."""
+    lines = [summary] if summary else []
+    lines.extend(f"Q: {question} A: {_first_sentence(answer)}" for question, answer in turns)
+    return "\n".join(lines)
+
+class CompactingMemory:
+    """Conversation memory with a hard size bound.
+
+    The last `recent_turns` question/answer pairs are kept as is, older ones are folded into
+    a rolling summary, `compact_batch` turns at a time, by `compact()`, which the caller runs after the answer was sent (off
+    the hot path). If compaction falls behind, turns beyond `max_turns` are folded in
+    extractively, so memory never grows past max_turns + the summary. The whole state is a
+    small JSON-able dict, which is what gets persisted and restored on resume.
+    """
+
+    def __init__(self, recent_turns=MEMORY_RECENT_TURNS, max_turns=MEMORY_MAX_TURNS,
+                 compact_batch=MEMORY_COMPACT_BATCH, summary_max_chars=SUMMARY_MAX_CHARS, summary="", turns=()):
+        self.recent_turns = recent_turns
+        self.max_turns = max(max_turns, recent_turns + compact_batch)
+        self.compact_batch = compact_batch
+        self.summary_max_chars = summary_max_chars
+        self.summary = summary
+        self.turns = deque(tuple(turn) for turn in turns)
+        self.compacting = False
+
+    @property
+    def messages(self):
+        """The summary (as a system message) followed by the recent turns, oldest first."""
+        messages = [SystemMessage(content=self.summary)] if self.summary else []
+        for question, answer in self.turns:
+            messages.append(HumanMessage(content=question))
+            messages.append(AIMessage(content=answer))
+        return messages
+
+    def add_turn(self, question, answer):
+        """Add a turn, returns how many old turns had to be folded into the summary."""
+        self.turns.append((question, answer))
+        if len(self.turns) <= self.max_turns:
+            return 0
+        overflow = [self.turns.popleft() for _ in range(len(self.turns) - self.max_turns)]
+        self._set_summary(extractive_summary(self.summary, overflow))
+        metrics.incr('memory_turns_dropped', len(overflow))
+        return len(overflow)
+
+    def needs_compaction(self):
+        return not self.compacting and len(self.turns) >= self.recent_turns + self.compact_batch
+
+    async def compact(self, llm=None):
+        """Fold the turns older than `recent_turns` into the summary, with the LLM if given.
+        Returns how many turns were folded."""
+        if not self.needs_compaction():
+            return 0
+        older = list(self.turns)[:len(self.turns) - self.recent_turns]
+        previous_summary = self.summary
+        self.compacting = True
+        try:
+            with metrics.timed('memory_compaction_seconds'):
+                if llm is None:
+                    summary = extractive_summary(self.summary, older)
+                else:
+                    turns = "\n".join(f"Human: {question}\nAssistant: {answer}" for question, answer in older)
+                    summary = await llm.ainvoke(SUMMARY_PROMPT.format(summary=self.summary or "(none)", turns=turns))
+        finally:
+            self.compacting = False
+        # The memory may have been cleared or overflowed while summarizing, then try again next turn
+        if self.summary != previous_summary or list(self.turns)[:len(older)] != older:
+            return 0
+        for _ in older:
+            self.turns.popleft()
+        self._set_summary(summary.strip())
+        metrics.incr('memory_compactions')
+        return len(older)
+
+    def _set_summary(self, summary):
+        if len(summary) > self.summary_max_chars:
+            # Keep the end, it holds the most recent facts
+            summary = summary[-self.summary_max_chars:]
+        self.summary = summary
+
+    def clear(self):
+        self.summary = ""
+        self.turns.clear()
+
+    def state(self):
+        return {'summary': self.summary, 'turns': [list(turn) for turn in self.turns]}
+
+    @classmethod
+    def from_state(cls, state, **kwargs):
+        return cls(summary=state.get('summary', ""), turns=state.get('turns', ()), **kwargs)
+
+    @classmethod
+    def from_thread_steps(cls, steps, **kwargs):
+        """Rebuild memory from the newest turns of a thread that has no saved state."""
+        memory = cls(**kwargs)
+        roots = [step for step in steps if step.get("parentId") is None]
+        # Only the newest max_turns pairs are needed, walk the thread from the end
+        pairs = []
+        answer = None
+        for step in reversed(roots):
+            if step["type"] == "user_message":
+                if answer is not None:
+                    pairs.append((step["output"], answer))
+                    answer = None
+                    if len(pairs) == memory.max_turns:
+                        break
+            elif answer is None:
+                answer = step["output"]
+        memory.turns.extend(reversed(pairs))
+        return memory
@@ -0,0 +1,137 @@
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Process-wide counters, gauges and timing samples (the last TIMING_WINDOW per name)
+TIMING_WINDOW = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_timings = defaultdict(lambda: deque(maxlen=TIMING_WINDOW))
+# Count and sum of every sample ever observed, for the Prometheus summaries
+_timing_totals = defaultdict(lambda: [0, 0.0])
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+def add_gauge(name, delta):
+    with _lock:
+        _gauges[name] = _gauges.get(name, 0) + delta
+        return _gauges[name]
+
+def get_gauge(name, default=0):
+    with _lock:
+        return _gauges.get(name, default)
+
+def observe(name, seconds):
+    with _lock:
+        _timings[name].append(seconds)
+        totals = _timing_totals[name]
+        totals[0] += 1
+        totals[1] += seconds
+
+@contextmanager
+def timed(name):
+    """Record how long the block took under `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+def summarize(values):
+    values = list(values)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+def snapshot():
+    """Current counters, gauges and timing summaries as plain dicts."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: list(values) for name, values in _timings.items()}
+    return {
+        'counters': counters,
+        'gauges': gauges,
+        'timings': {name: summarize(values) for name, values in timings.items()},
+    }
+
+def current_rss_bytes():
+    """Resident set size of this process (peak RSS where /proc is not available)."""
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS, close enough as a fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+METRIC_PREFIX = "terraria_"
+_NAME_PATTERN = re.compile(r"^([^{]+)(\{.*\})?$")
+
+def _metric_name(name):
+    """Split "name{label=...}" and make the name a valid Prometheus metric name."""
+    match = _NAME_PATTERN.match(name)
+    base, labels = match.group(1), match.group(2) or ""
+    return METRIC_PREFIX + re.sub(r"[^a-zA-Z0-9_]", "_", base), labels
+
+def _with_label(labels, label):
+    return "{" + ",".join(part for part in [labels[1:-1], label] if part) + "}"
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format. Timings are summaries whose
+    quantiles cover the last TIMING_WINDOW samples, count and sum cover the whole run."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: list(values) for name, values in _timings.items()}
+        totals = {name: tuple(values) for name, values in _timing_totals.items()}
+
+    lines = []
+    typed = set()
+
+    def declare(metric, kind):
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} {kind}")
+
+    for name, value in sorted(counters.items()):
+        metric, labels = _metric_name(name)
+        declare(f"{metric}_total", "counter")
+        lines.append(f"{metric}_total{labels} {value}")
+    for name, value in sorted(gauges.items()):
+        metric, labels = _metric_name(name)
+        declare(metric, "gauge")
+        lines.append(f"{metric}{labels} {value}")
+    for name, values in sorted(timings.items()):
+        metric, labels = _metric_name(name)
+        declare(metric, "summary")
+        for quantile in (0.5, 0.95, 0.99):
+            label = _with_label(labels, 'quantile="%s"' % quantile)
+            lines.append(f"{metric}{label} {percentile(values, quantile * 100)}")
+        count, total = totals[name]
+        lines.append(f"{metric}_count{labels} {count}")
+        lines.append(f"{metric}_sum{labels} {total}")
+    return "\n".join(lines) + "\n"
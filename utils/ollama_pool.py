@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from typing import Any, List, Optional
+
+import requests
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_ollama import OllamaLLM
+
+from utils import metrics
+
+# Comma separated Ollama servers, e.g. "http://10.0.0.5:11434,http://10.0.0.6:11434"
+OLLAMA_BASE_URLS = [url.strip().rstrip('/') for url in
+                    os.environ.get("OLLAMA_BASE_URLS", "http://localhost:11434").split(',') if url.strip()]
+# A backend is taken out of rotation after this many failures in a row, for BREAKER_COOLDOWN seconds
+BREAKER_FAILURES = int(os.environ.get("OLLAMA_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.environ.get("OLLAMA_BREAKER_COOLDOWN", "30"))
+HEALTH_CHECK_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "15"))
+HEALTH_CHECK_TIMEOUT = 2.0
+
+class NoBackendAvailable(RuntimeError):
+    """Every Ollama backend is unhealthy, tripped, or already failed this request."""
+
+class OllamaBackend:
+    """One Ollama server: its client, in-flight request count and circuit breaker state."""
+
+    def __init__(self, base_url, model, **llm_kwargs):
+        self.base_url = base_url
+        self.model = model
+        self.llm = OllamaLLM(model=model, base_url=base_url, **llm_kwargs)
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+
+    def available(self, now):
+        # After the cooldown the breaker is half open: the next request is a trial
+        return self.healthy and now >= self.open_until
+
+    def check_health(self):
+        """Ask the server for its model list; healthy means it answers and has our model."""
+        try:
+            response = requests.get(f"{self.base_url}/api/tags", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            names = {model.get('name') for model in response.json().get('models', [])}
+            self.healthy = self.model in names or f"{self.model}:latest" in names
+        except (requests.RequestException, ValueError):
+            self.healthy = False
+        metrics.set_gauge(f'ollama_backend_healthy{{backend="{self.base_url}"}}', int(self.healthy))
+        return self.healthy
+
+class OllamaPool:
+    """Routes generations to the backend with the fewest requests in flight.
+
+    A backend that fails BREAKER_FAILURES times in a row is skipped for BREAKER_COOLDOWN
+    seconds (circuit breaker); backends found unhealthy by the periodic health check are
+    skipped until they pass it again.
+    """
+
+    def __init__(self, base_urls=OLLAMA_BASE_URLS, model="llama3.2:3b", breaker_failures=BREAKER_FAILURES,
+                 breaker_cooldown=BREAKER_COOLDOWN, **llm_kwargs):
+        if not base_urls:
+            raise ValueError("At least one Ollama base URL is required.")
+        self.backends = [OllamaBackend(url, model, **llm_kwargs) for url in base_urls]
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def acquire(self, exclude=()):
+        """Pick the least loaded available backend not in `exclude` and count the request on it."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [backend for backend in self.backends
+                          if backend not in exclude and backend.available(now)]
+            if not candidates:
+                raise NoBackendAvailable("No Ollama backend is available.")
+            backend = min(candidates, key=lambda backend: backend.outstanding)
+            backend.outstanding += 1
+            if backend.open_until:
+                # Half open trial: block other requests until this one tells us the result
+                backend.open_until = now + self.breaker_cooldown
+            return backend
+
+    def release(self, backend, ok):
+        """Count the request as done; ok=None (e.g. cancelled) says nothing about the backend."""
+        with self._lock:
+            backend.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                backend.failures = 0
+                backend.open_until = 0.0
+            else:
+                backend.failures += 1
+                metrics.incr('ollama_backend_failures')
+                if backend.failures >= self.breaker_failures:
+                    backend.open_until = time.monotonic() + self.breaker_cooldown
+                    metrics.incr('ollama_breaker_opened')
+
+    def check_health(self):
+        for backend in self.backends:
+            backend.check_health()
+        return {backend.base_url: backend.healthy for backend in self.backends}
+
+    def start_health_checks(self, interval=HEALTH_CHECK_INTERVAL):
+        """Check every backend now and then every `interval` seconds in a daemon thread."""
+        if self._health_thread is not None:
+            return
+
+        def loop():
+            while True:
+                self.check_health()
+                time.sleep(interval)
+
+        self._health_thread = threading.Thread(target=loop, name="ollama-health", daemon=True)
+        self._health_thread.start()
+
+class PooledOllamaLLM(LLM):
+    """LangChain LLM over an OllamaPool.
+
+    Tokens are streamed through this LLM's own callbacks, so tags and streaming handlers
+    work as with a single OllamaLLM. A failed generation is retried on another backend as
+    long as no token has reached the user yet.
+    """
+
+    pool: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        tried = []
+        while True:
+            backend = self._next_backend(tried)
+            tokens = []
+            # Released exactly once per attempt; a cancellation (stop button, disconnect)
+            # leaves ok None, so it doesn't count against the backend's breaker
+            ok = None
+            try:
+                for token in backend.llm.stream(prompt, stop=stop, **kwargs):
+                    tokens.append(token)
+                    if run_manager:
+                        run_manager.on_llm_new_token(token)
+                ok = True
+                return ''.join(tokens)
+            except Exception:
+                ok = False
+                if tokens or len(tried) == len(self.pool.backends):
+                    raise
+                metrics.incr('ollama_retries')
+            finally:
+                self.pool.release(backend, ok)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        tried = []
+        while True:
+            backend = self._next_backend(tried)
+            tokens = []
+            # Released exactly once per attempt; a cancellation (stop button, disconnect)
+            # leaves ok None, so it doesn't count against the backend's breaker
+            ok = None
+            try:
+                async for token in backend.llm.astream(prompt, stop=stop, **kwargs):
+                    tokens.append(token)
+                    if run_manager:
+                        await run_manager.on_llm_new_token(token)
+                ok = True
+                return ''.join(tokens)
+            except Exception:
+                ok = False
+                if tokens or len(tried) == len(self.pool.backends):
+                    raise
+                metrics.incr('ollama_retries')
+            finally:
+                self.pool.release(backend, ok)
+
+    def _next_backend(self, tried):
+        backend = self.pool.acquire(exclude=tried)
+        tried.append(backend)
+        metrics.incr(f'ollama_requests{{backend="{backend.base_url}"}}')
+        return backend
@@ -0,0 +1,74 @@
+import builtins
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from utils import metrics
+
+# Print the startup report once the app is warm
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+# Imports faster than this are left out of the report
+IMPORT_REPORT_MIN_SECONDS = 0.01
+
+_started = time.perf_counter()
+_import_seconds = defaultdict(float)
+_phases = {}
+_local = threading.local()
+_original_import = None
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Only time the outermost import of a module that isn't loaded yet, nested imports are
+    # part of its time (like the cumulative column of python -X importtime)
+    if level or getattr(_local, 'depth', 0) or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _local.depth = 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = 0
+        elapsed = time.perf_counter() - start
+        if elapsed >= IMPORT_REPORT_MIN_SECONDS:
+            _import_seconds[name] += elapsed
+
+def start():
+    """Start the startup clock; with STARTUP_PROFILE every new top-level import is timed too."""
+    global _original_import, _started
+    _started = time.perf_counter()
+    if STARTUP_PROFILE and builtins.__import__ is not _timed_import:
+        _original_import = builtins.__import__
+        builtins.__import__ = _timed_import
+
+def stop():
+    """Stop timing imports once the process is warm, restoring the original __import__."""
+    if builtins.__import__ is _timed_import:
+        # _original_import stays set for imports still running in other threads
+        builtins.__import__ = _original_import
+
+def mark(phase):
+    """Record that `phase` was reached, in seconds since start()."""
+    _phases[phase] = time.perf_counter() - _started
+    metrics.set_gauge(f'startup_seconds{{phase="{phase}"}}', _phases[phase])
+
+def report():
+    """Import time per module, model and index load time and startup phases, as a dict."""
+    timings = metrics.snapshot()['timings']
+    loads = {name: timings[name]['max'] for name in ('embedding_model_load_seconds', 'index_load_seconds')
+             if name in timings}
+    return {
+        'imports': dict(sorted(_import_seconds.items(), key=lambda item: item[1], reverse=True)),
+        'loads': loads,
+        'phases': dict(_phases),
+    }
+
+def print_report():
+    data = report()
+    print("Startup profile (seconds)")
+    for name, seconds in data['imports'].items():
+        print(f"  import {name:<48}{seconds:8.3f}")
+    for name, seconds in data['loads'].items():
+        print(f"  {name:<55}{seconds:8.3f}")
+    for name, seconds in data['phases'].items():
+        print(f"  {name + ' (since start)':<55}{seconds:8.3f}")
@@ -0,0 +1,180 @@
+import os
+import re
+from typing import Any, Dict, Optional
+
+from langchain.chains import ConversationalRetrievalChain
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+from langchain_core.messages import BaseMessage
+
+from utils import metrics
+from utils.tracing import span
+
+# Token budget of the whole answer prompt (template + history + context + question). Ollama's
+# default context is 2048 tokens, the rest is left for the answer
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1500"))
+# Part of that budget the conversation history may use, newest turns are kept first
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "300"))
+
+# Words that point back into the conversation ("what about its defense?")
+REFERENCE_WORDS = re.compile(
+    r"\b(it|its|it's|they|them|their|this|that|these|those|he|him|his|she|her|there|"
+    r"one|ones|also|too|else|same|another|other|again|former|latter)\b", re.IGNORECASE)
+FOLLOW_UP_OPENINGS = re.compile(r"^\s*(and|or|but|so|what about|how about|then)\b", re.IGNORECASE)
+
+def count_tokens(text):
+    """Approximate token count, about 4 characters per token for English text. Cheap enough
+    to run on every turn, and close enough to budget the prompt with some headroom."""
+    return (len(text) + 3) // 4 if text else 0
+
+def is_self_contained(question):
+    """True when the question doesn't refer back to the conversation and can be searched as is."""
+    return not REFERENCE_WORDS.search(question) and not FOLLOW_UP_OPENINGS.search(question)
+
+def truncate_to_tokens(text, token_budget):
+    """Cut text to about token_budget tokens on a word boundary, marking the cut with "..."."""
+    if count_tokens(text) <= token_budget:
+        return text
+    cut = text[:max(0, token_budget * 4 - 3)]
+    cut = cut.rsplit(' ', 1)[0] if ' ' in cut else cut
+    return f"{cut.rstrip()}..." if cut.strip() else ""
+
+def format_history(messages, token_budget=HISTORY_TOKEN_BUDGET):
+    """Render the most recent messages that fit the budget, oldest first, as "Human:/Assistant:" lines.
+
+    The last human message is always kept (cut to the budget if it's longer on its own), and
+    the message that overflows the budget is cut instead of dropped, so one long answer
+    doesn't leave a follow-up without any history.
+    """
+    lines = []
+    for message in messages:
+        if isinstance(message, BaseMessage):
+            role = {"human": "Human", "system": "Summary"}.get(message.type, "Assistant")
+            lines.append((role, message.content))
+        else:
+            lines.append(("Human", message[0]))
+    last_human = max((i for i, (role, _) in enumerate(lines) if role == "Human"), default=None)
+
+    def cut(position, budget):
+        role, content = lines[position]
+        content = truncate_to_tokens(content, budget - count_tokens(f"{role}: "))
+        return f"{role}: {content}" if content else None
+
+    kept = {}
+    used = 0
+    if last_human is not None:
+        role, content = lines[last_human]
+        kept[last_human] = cut(last_human, token_budget) or f"{role}: {content}"
+        used += count_tokens(kept[last_human])
+    for position in reversed(range(len(lines))):
+        if position == last_human:
+            continue
+        line = "{}: {}".format(*lines[position])
+        if used + count_tokens(line) > token_budget:
+            # The overflowing message is cut to what is left, the older ones don't fit at all
+            line = cut(position, token_budget - used)
+            if line:
+                kept[position] = line
+            break
+        kept[position] = line
+        used += count_tokens(line)
+    return "\n".join(kept[position] for position in sorted(kept))
+
+class BudgetedRetrievalChain(ConversationalRetrievalChain):
+    """ConversationalRetrievalChain that only condenses real follow-ups and packs the answer
+    prompt under a token budget.
+
+    The question-condensing LLM call is skipped when there is no history (new chat or memory
+    just reset) or when the question is self-contained. History is trimmed to
+    HISTORY_TOKEN_BUDGET and the retrieved chunks, in rank order, are kept while they fit in
+    what is left of PROMPT_TOKEN_BUDGET. History is passed in by the caller, the chain has
+    no memory of its own. Token counts of each turn are returned under "token_counts".
+    """
+
+    prompt_token_budget: int = PROMPT_TOKEN_BUDGET
+    history_token_budget: int = HISTORY_TOKEN_BUDGET
+
+    def _history(self, inputs):
+        return format_history(inputs.get("chat_history") or [], self.history_token_budget)
+
+    def _should_condense(self, question, history):
+        condense = bool(history) and not is_self_contained(question)
+        metrics.incr('condense_calls' if condense else 'condense_skipped')
+        return condense
+
+    def _pack(self, question, history, docs):
+        """Keep the chunks that fit the budget and count the prompt's tokens."""
+        template = self.combine_docs_chain.llm_chain.prompt.template
+        fixed = count_tokens(template) + count_tokens(question) + count_tokens(history)
+        kept = []
+        context_tokens = 0
+        for doc in docs:
+            tokens = count_tokens(doc.page_content)
+            if fixed + context_tokens + tokens > self.prompt_token_budget:
+                break
+            kept.append(doc)
+            context_tokens += tokens
+        counts = {
+            'history': count_tokens(history),
+            'context': context_tokens,
+            'prompt': fixed + context_tokens,
+            'chunks_kept': len(kept),
+            'chunks_dropped': len(docs) - len(kept),
+        }
+        return kept, counts
+
+    def _output(self, docs, answer, new_question, counts, condensed):
+        counts.update(answer=count_tokens(answer), condensed=condensed)
+        metrics.observe('prompt_tokens', counts['prompt'])
+        metrics.observe('history_tokens', counts['history'])
+        metrics.observe('answer_tokens', counts['answer'])
+        output = {self.output_key: answer, 'token_counts': counts}
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
+
+    def _call(self, inputs: Dict[str, Any], run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        history = self._history(inputs)
+        condensed = self._should_condense(question, history)
+        new_question = question
+        if condensed:
+            with span('condense'):
+                new_question = self.question_generator.run(question=question, chat_history=history,
+                                                           callbacks=_run_manager.get_child())
+        prompt_question = new_question if self.rephrase_question else question
+        with span('retrieval'):
+            docs = self._get_docs(new_question, inputs, run_manager=_run_manager)
+        with span('prompt_build'):
+            docs, counts = self._pack(prompt_question, history, docs)
+        if self.response_if_no_docs_found is not None and not docs:
+            return self._output(docs, self.response_if_no_docs_found, new_question, counts, condensed)
+        with span('generation'):
+            answer = self.combine_docs_chain.run(input_documents=docs, callbacks=_run_manager.get_child(),
+                                                 question=prompt_question, chat_history=history)
+        return self._output(docs, answer, new_question, counts, condensed)
+
+    async def _acall(self, inputs: Dict[str, Any],
+                     run_manager: Optional[AsyncCallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        history = self._history(inputs)
+        condensed = self._should_condense(question, history)
+        new_question = question
+        if condensed:
+            with span('condense'):
+                new_question = await self.question_generator.arun(question=question, chat_history=history,
+                                                                  callbacks=_run_manager.get_child())
+        prompt_question = new_question if self.rephrase_question else question
+        with span('retrieval'):
+            docs = await self._aget_docs(new_question, inputs, run_manager=_run_manager)
+        with span('prompt_build'):
+            docs, counts = self._pack(prompt_question, history, docs)
+        if self.response_if_no_docs_found is not None and not docs:
+            return self._output(docs, self.response_if_no_docs_found, new_question, counts, condensed)
+        with span('generation'):
+            answer = await self.combine_docs_chain.arun(input_documents=docs, callbacks=_run_manager.get_child(),
+                                                        question=prompt_question, chat_history=history)
+        return self._output(docs, answer, new_question, counts, condensed)
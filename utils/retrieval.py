@@ -0,0 +1,98 @@
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from utils import metrics
+
+class BossRouter:
+    """Finds which boss a question is about by matching boss names (longest name first)."""
+
+    def __init__(self, bosses):
+        self.bosses = sorted(bosses, key=len, reverse=True)
+        self._patterns = [(boss, re.compile(rf"\b{_name_pattern(boss)}\b", re.IGNORECASE)) for boss in self.bosses]
+
+    def detect(self, question):
+        for boss, pattern in self._patterns:
+            if pattern.search(question):
+                return boss
+        return None
+
+    def strip(self, question, boss):
+        """Remove the boss name from the question, inside a boss partition it matches everything."""
+        for name, pattern in self._patterns:
+            if name == boss:
+                return pattern.sub(' ', question)
+        return question
+
+def _name_pattern(boss):
+    # "Skeletron Prime", "skeletron_prime" and "Skeletron-Prime's" all match
+    words = [re.escape(word) for word in re.split(r'[\s_]+', boss.strip()) if word]
+    return r"[\s_-]+".join(words)
+
+class BossRoutedRetriever(BaseRetriever):
+    """Searches only the partition of the boss a question mentions.
+
+    When a question names no boss, the boss of the previous routed question in this
+    session is reused; without any boss the whole index is searched. With a BM25 index,
+    dense and lexical candidates are merged by reciprocal rank fusion, so a chunk that
+    contains the exact item or buff name is found without raising k.
+    """
+
+    db: Any
+    partitions: Dict[str, Any] = {}
+    partition_ids: Dict[str, Set[str]] = {}
+    router: Optional[Any] = None
+    lexical: Optional[Any] = None
+    k: int = 2
+    fetch_k: int = 8
+    lexical_weight: float = 1.0
+    rrf_k: int = 60
+    current_boss: Optional[str] = None
+
+    def route(self, query):
+        boss = self.router.detect(query) if self.router else None
+        if boss is None:
+            boss = self.current_boss
+        if boss is not None and boss in self.partitions:
+            self.current_boss = boss
+            return boss, self.partitions[boss]
+        return None, self.db
+
+    def reset(self):
+        """Forget the carried-over boss, e.g. after the topic changed."""
+        self.current_boss = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        boss, store = self.route(query)
+        metrics.incr('retrieval_routed' if boss else 'retrieval_global')
+        if self.lexical is None:
+            return store.similarity_search(query, k=self.k)
+        return self._hybrid_search(query, store, boss)
+
+    def _hybrid_search(self, query, store, boss):
+        dense = store.similarity_search(query, k=self.fetch_k)
+        if boss:
+            lexical = self.lexical.search(self.router.strip(query, boss), k=self.fetch_k,
+                                          allowed=self.partition_ids.get(boss))
+        else:
+            lexical = self.lexical.search(query, k=self.fetch_k)
+
+        scores = {}
+        documents = {}
+        for rank, doc in enumerate(dense):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1 / (self.rrf_k + rank + 1)
+            documents[doc.id] = doc
+        for rank, (doc_id, _) in enumerate(lexical):
+            scores[doc_id] = scores.get(doc_id, 0.0) + self.lexical_weight / (self.rrf_k + rank + 1)
+        if lexical:
+            metrics.incr('retrieval_lexical_matches')
+
+        results = []
+        for doc_id in sorted(scores, key=scores.get, reverse=True)[:self.k]:
+            doc = documents.get(doc_id) or store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                results.append(doc)
+        return results
@@ -0,0 +1,255 @@
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+
+from utils import metrics
+
+# Where per-conversation state lives: "sqlite" (a file every worker on the host can open)
+# or "memory" (this process only, e.g. a single worker or the benchmarks)
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "cache/sessions.sqlite")
+# Conversations not active for this many seconds are purged (default one week)
+SESSION_TTL = float(os.environ.get("SESSION_TTL", str(7 * 24 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    summary TEXT NOT NULL DEFAULT '',
+    boss TEXT,
+    topic BLOB,
+    epoch INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    session TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    PRIMARY KEY (session, seq)
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+class SessionStore(ABC):
+    """Conversation state kept outside the worker process, keyed by the thread id.
+
+    The state of a conversation is the compact memory (summary + recent turns, see
+    CompactingMemory.state()), the boss the retriever carries over and the topic centroid
+    (TopicTracker.to_bytes()). Writes are
+    incremental: a turn is one appended row, compaction rewrites the summary and drops the
+    turns it folded, so a turn never rewrites the whole conversation. The epoch counts the
+    times the conversation was cleared or rewritten, so a compaction started before that
+    can tell its turns are gone.
+    """
+
+    @abstractmethod
+    def load(self, session):
+        """Return {'summary', 'turns', 'boss', 'topic', 'epoch'} or None when nothing was saved for the session."""
+
+    @abstractmethod
+    def append_turn(self, session, question, answer, boss=None, topic=None):
+        pass
+
+    @abstractmethod
+    def save_state(self, session, state, boss=None):
+        """Write a whole memory state, only used to seed the store (e.g. an older resumed thread).
+        Returns the new epoch."""
+
+    @abstractmethod
+    def fold_turns(self, session, summary, folded, previous_summary, epoch):
+        """Replace the summary and drop the `folded` oldest turns, which it now covers.
+
+        Skipped (returns False) when the stored summary is no longer `previous_summary` or the
+        epoch is no longer `epoch`, i.e. another worker compacted, cleared or rewrote the
+        conversation in the meantime.
+        """
+
+    @abstractmethod
+    def clear(self, session):
+        """Forget the conversation, e.g. after the topic changed. Returns the new epoch."""
+
+    @abstractmethod
+    def purge(self, max_age=SESSION_TTL):
+        """Delete the conversations not active for max_age seconds, returns how many."""
+
+class MemorySessionStore(SessionStore):
+    """In-process store, for a single worker."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, session):
+        state = self._sessions.setdefault(session, {'summary': "", 'turns': [], 'boss': None, 'topic': None,
+                                                    'epoch': 0})
+        state['updated'] = time.time()
+        return state
+
+    def load(self, session):
+        with self._lock:
+            state = self._sessions.get(session)
+            if state is None:
+                return None
+            return {'summary': state['summary'], 'turns': [list(turn) for turn in state['turns']],
+                    'boss': state['boss'], 'topic': state['topic'], 'epoch': state['epoch']}
+
+    def append_turn(self, session, question, answer, boss=None, topic=None):
+        with self._lock:
+            state = self._session(session)
+            state['turns'].append((question, answer))
+            state['boss'] = boss
+            state['topic'] = topic
+
+    def save_state(self, session, state, boss=None):
+        with self._lock:
+            epoch = self._sessions.get(session, {}).get('epoch', 0) + 1
+            self._sessions[session] = {'summary': state.get('summary', ""),
+                                       'turns': [tuple(turn) for turn in state.get('turns', ())], 'boss': boss,
+                                       'topic': None, 'epoch': epoch, 'updated': time.time()}
+            return epoch
+
+    def fold_turns(self, session, summary, folded, previous_summary, epoch):
+        with self._lock:
+            state = self._session(session)
+            if state['summary'] != previous_summary or state['epoch'] != epoch:
+                return False
+            state['summary'] = summary
+            del state['turns'][:folded]
+            return True
+
+    def clear(self, session):
+        with self._lock:
+            epoch = self._sessions.get(session, {}).get('epoch', 0) + 1
+            self._sessions[session] = {'summary': "", 'turns': [], 'boss': None, 'topic': None, 'epoch': epoch,
+                                       'updated': time.time()}
+            return epoch
+
+    def purge(self, max_age=SESSION_TTL):
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [session for session, state in self._sessions.items() if state['updated'] < cutoff]
+            for session in expired:
+                del self._sessions[session]
+        return len(expired)
+
+class SQLiteSessionStore(SessionStore):
+    """Store in a SQLite file in WAL mode, shared by all the workers of one host."""
+
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One connection per process, the writes are a row or two and serialized by the lock
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(sessions)")}
+        if 'topic' not in columns:
+            # Stores created before topic tracking
+            self._connection.execute("ALTER TABLE sessions ADD COLUMN topic BLOB")
+        if 'epoch' not in columns:
+            # Stores created before compactions were guarded by the epoch
+            self._connection.execute("ALTER TABLE sessions ADD COLUMN epoch INTEGER NOT NULL DEFAULT 0")
+        self._lock = threading.Lock()
+
+    def _write(self, statements, check=None, result=None):
+        """Run the statements in one transaction; `check` (sql, params, expected row) guards it
+        and `result` (sql, params) is read back before committing, its first value is returned."""
+        with self._lock, metrics.timed('session_store_write_seconds'):
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                if check is not None:
+                    sql, params, expected = check
+                    row = self._connection.execute(sql, params).fetchone()
+                    if (tuple(row) if row else None) != expected:
+                        self._connection.execute("ROLLBACK")
+                        return False
+                for sql, params in statements:
+                    self._connection.execute(sql, params)
+                value = self._connection.execute(*result).fetchone()[0] if result else True
+                self._connection.execute("COMMIT")
+                return value
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _touch(self, session):
+        return ("INSERT INTO sessions (session, updated) VALUES (?, ?) "
+                "ON CONFLICT(session) DO UPDATE SET updated = excluded.updated", (session, time.time()))
+
+    def _select_epoch(self, session):
+        return ("SELECT epoch FROM sessions WHERE session = ?", (session,))
+
+    def load(self, session):
+        with self._lock, metrics.timed('session_store_read_seconds'):
+            row = self._connection.execute(
+                "SELECT summary, boss, topic, epoch FROM sessions WHERE session = ?", (session,)).fetchone()
+            if row is None:
+                return None
+            turns = self._connection.execute(
+                "SELECT question, answer FROM turns WHERE session = ? ORDER BY seq", (session,)).fetchall()
+        return {'summary': row[0], 'turns': [list(turn) for turn in turns], 'boss': row[1], 'topic': row[2],
+                'epoch': row[3]}
+
+    def append_turn(self, session, question, answer, boss=None, topic=None):
+        self._write([
+            self._touch(session),
+            ("UPDATE sessions SET boss = ?, topic = ? WHERE session = ?", (boss, topic, session)),
+            ("INSERT INTO turns (session, seq, question, answer) VALUES "
+             "(?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM turns WHERE session = ?), ?, ?)",
+             (session, session, question, answer)),
+        ])
+
+    def save_state(self, session, state, boss=None):
+        turns = [(session, seq, question, answer) for seq, (question, answer) in enumerate(state.get('turns', ()), 1)]
+        return self._write([
+            ("DELETE FROM turns WHERE session = ?", (session,)),
+            self._touch(session),
+            ("UPDATE sessions SET summary = ?, boss = ?, topic = NULL, epoch = epoch + 1 WHERE session = ?",
+             (state.get('summary', ""), boss, session)),
+        ] + [("INSERT INTO turns (session, seq, question, answer) VALUES (?, ?, ?, ?)", turn) for turn in turns],
+            result=self._select_epoch(session))
+
+    def fold_turns(self, session, summary, folded, previous_summary, epoch):
+        return self._write([
+            self._touch(session),
+            ("UPDATE sessions SET summary = ? WHERE session = ?", (summary, session)),
+            ("DELETE FROM turns WHERE session = ? AND seq IN "
+             "(SELECT seq FROM turns WHERE session = ? ORDER BY seq LIMIT ?)", (session, session, folded)),
+        ], check=("SELECT summary, epoch FROM sessions WHERE session = ?", (session,), (previous_summary, epoch)))
+
+    def clear(self, session):
+        # The empty row stays, so a resume doesn't rebuild the old turns from the thread
+        return self._write([
+            ("DELETE FROM turns WHERE session = ?", (session,)),
+            self._touch(session),
+            ("UPDATE sessions SET summary = '', boss = NULL, topic = NULL, epoch = epoch + 1 WHERE session = ?",
+             (session,)),
+        ], result=self._select_epoch(session))
+
+    def purge(self, max_age=SESSION_TTL):
+        cutoff = time.time() - max_age
+        with self._lock, metrics.timed('session_store_write_seconds'):
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "DELETE FROM turns WHERE session IN (SELECT session FROM sessions WHERE updated < ?)", (cutoff,))
+                purged = self._connection.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return purged
+
+    def close(self):
+        self._connection.close()
+
+def create_session_store(kind=SESSION_STORE, path=SESSION_DB_PATH):
+    if kind == "sqlite":
+        return SQLiteSessionStore(path)
+    if kind == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE '{kind}', expected 'sqlite' or 'memory'.")
@@ -0,0 +1,192 @@
+import os
+import re
+import sqlite3
+
+# Typed stats table: one row per boss / form / stat / difficulty mode (/ attack for damage)
+SCHEMA = """
+CREATE TABLE stats (
+    boss TEXT NOT NULL,
+    form TEXT NOT NULL,
+    stat TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    attack TEXT,
+    value TEXT NOT NULL,
+    number REAL
+);
+CREATE INDEX stats_lookup ON stats (boss, form, stat, mode);
+"""
+
+STAT_COLUMNS = ('boss', 'form', 'stat', 'mode', 'attack', 'value', 'number')
+
+# Words that name a stat in a question, most specific first
+STAT_ALIASES = [
+    ('knockback_resist', ['knockback resist', 'knockback resistance', 'knockback', 'kb resist']),
+    ('defense_increased', ['increased defense', 'increased defence']),
+    ('max_life', ['max life', 'maximum life', 'max health', 'health', 'hp', 'life']),
+    ('defense', ['defense', 'defence']),
+    ('damage', ['damage', 'dmg']),
+    ('coins', ['coins', 'coin', 'money']),
+    ('immune_to', ['immune', 'immunity', 'immunities']),
+]
+STAT_LABELS = {
+    'max_life': 'max life', 'defense': 'defense', 'defense_increased': 'increased defense',
+    'damage': 'damage', 'knockback_resist': 'knockback resistance', 'coins': 'coin drop',
+    'immune_to': 'immunities',
+}
+MODES = ['Normal', 'Expert', 'Master']
+# Questions with these words need reasoning or context, they always go to the LLM
+REASONING_WORDS = re.compile(
+    r"\b(why|how (?:do|can|should|to)|compare|compared|versus|vs|than|better|worse|best|should|"
+    r"strategy|beat|defeat|kill|tips?|difference|explain|which)\b", re.IGNORECASE)
+# Yes/no questions ("Is Skeletron Prime immune to poison?") need an answer, not the stat value
+YES_NO_QUESTION = re.compile(r"^\W*(is|are|was|were|does|do|did|can|could|will|would|has|have)\b", re.IGNORECASE)
+# The only words a direct stat question may contain besides the boss/form, the stat and the
+# mode; any other word (arms, minions, projectiles...) is about something else
+FILLER_WORDS = {
+    'what', 'whats', 'is', 'are', 'the', 'of', 's', 'does', 'do', 'have', 'has', 'in', 'on', 'at', 'for',
+    'a', 'an', 'how', 'much', 'many', 'tell', 'me', 'about', 'give', 'show', 'with', 'stat', 'stats',
+    'value', 'base', 'mode', 'difficulty', 'please', 'to', 'deal', 'deals', 'drop', 'drops', 'get',
+}
+
+def save_stats_table(rows, path):
+    """Write the rows to a fresh SQLite file and swap it in place."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(SCHEMA)
+        connection.executemany(
+            f"INSERT INTO stats ({', '.join(STAT_COLUMNS)}) VALUES ({', '.join('?' * len(STAT_COLUMNS))})",
+            [tuple(row.get(column) for column in STAT_COLUMNS) for row in rows])
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+class StatsTable:
+    """The stats table held in memory, indexed by (boss, form, stat) for millisecond lookups."""
+
+    def __init__(self, rows):
+        self.rows = {}
+        forms = {}
+        for row in rows:
+            self.rows.setdefault((row['boss'], row['form'], row['stat']), []).append(row)
+            forms.setdefault(row['boss'], set()).add(row['form'])
+        self.forms = forms
+        every_form = [form for boss_forms in forms.values() for form in boss_forms]
+        self.shared_forms = {form for form in every_form if every_form.count(form) > 1}
+        # Match boss and form names longest first; several bosses can share a form name ("Phase 1")
+        names = sorted({form for boss_forms in forms.values() for form in boss_forms} | set(forms), key=len, reverse=True)
+        self._name_patterns = [(name, re.compile(rf"\b{_words_pattern(name)}\b", re.IGNORECASE)) for name in names]
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls([])
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = connection.execute(f"SELECT {', '.join(STAT_COLUMNS)} FROM stats")
+            rows = [dict(zip(STAT_COLUMNS, values)) for values in cursor]
+        finally:
+            connection.close()
+        return cls(rows)
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.rows.values())
+
+    def find_form(self, question):
+        """Return (boss, form, rest) for the one form the question is about, with the matched
+        names blanked out of `rest`, or None when there is none or it is ambiguous."""
+        names = []
+        for name, pattern in self._name_patterns:
+            if pattern.search(question):
+                names.append(name)
+                # "Skeletron Prime" must not also count as "Skeletron"
+                question = pattern.sub(' ', question)
+        if not names:
+            return None
+
+        bosses = [boss for boss in self.forms if boss in names]
+        candidates = {(boss, form) for boss, boss_forms in self.forms.items() for form in boss_forms
+                      if form in names and (not bosses or boss in bosses)}
+        if not candidates:
+            # Only a boss name, which has no form of its own in the table
+            return None
+        if len(candidates) > 1:
+            # "Skeletron Prime Phase 1": the named form wins over the boss's main form
+            candidates = {(boss, form) for boss, form in candidates if form != boss}
+        if len(candidates) != 1:
+            return None
+        boss, form = candidates.pop()
+        return boss, form, question
+
+    def lookup(self, boss, form, stat, modes=None):
+        rows = self.rows.get((boss, form, stat), [])
+        if modes:
+            rows = [row for row in rows if row['mode'] in modes or row['mode'] == 'All']
+        return rows
+
+def _words_pattern(name):
+    words = [re.escape(word) for word in re.split(r'[\s_]+', name.strip()) if word]
+    return r"[\s_-]+".join(words)
+
+def _find_stat(question):
+    """Return the stats named in the question and the question without their words."""
+    lowered = question.lower()
+    found = []
+    for stat, aliases in STAT_ALIASES:
+        if any(re.search(rf"\b{re.escape(alias)}\b", lowered) for alias in aliases):
+            found.append(stat)
+            lowered = re.sub('|'.join(rf"\b{re.escape(alias)}\b" for alias in aliases), ' ', lowered)
+    return found, lowered
+
+def _words(text):
+    return set(re.findall(r"[a-z]+", text.lower()))
+
+def answer_stat_question(question, table):
+    """Answer a direct stat lookup ("What is Skeletron Prime's Master mode max life?") from the
+    stats table, or return None when the question needs the retrieval chain.
+
+    Only questions made of the boss/form, one stat, optional modes (and attack names for
+    damage) plus filler words qualify: "the life of Skeletron Prime's arms" is about the
+    arms, and "Is it immune to poison?" wants a yes or no.
+    """
+    if not table.rows or REASONING_WORDS.search(question) or YES_NO_QUESTION.search(question):
+        return None
+    match = table.find_form(question)
+    if match is None:
+        return None
+    boss, form, rest = match
+    stats, rest = _find_stat(rest)
+    if len(stats) != 1:
+        return None
+
+    stat = stats[0]
+    modes = [mode for mode in MODES if re.search(rf"\b{mode}\b", rest, re.IGNORECASE)]
+    other_words = _words(rest) - FILLER_WORDS - _words(' '.join(modes))
+    rows = table.lookup(boss, form, stat, modes)
+    if other_words and stat == 'damage':
+        # "Skeletron Prime's head damage": the extra words name an attack of this form
+        rows = [row for row in rows if row['attack'] and other_words <= _words(row['attack'])]
+        other_words = set()
+    if other_words or not rows:
+        return None
+    # A shared form name ("Phase 1") is only clear together with its boss
+    name = f"{boss} {form}" if form in table.shared_forms else form
+    return format_stat_answer(name, stat, rows)
+
+def format_stat_answer(form, stat, rows):
+    label = STAT_LABELS.get(stat, stat)
+    if len(rows) == 1 and not rows[0]['attack']:
+        row = rows[0]
+        mode = '' if row['mode'] == 'All' else f" in {row['mode']} mode"
+        verb = 'are' if stat == 'immune_to' else 'is'
+        return f"{form}'s {label}{mode} {verb} {row['value']}."
+
+    parts = []
+    for row in rows:
+        where = ' / '.join(part for part in [row['attack'], None if row['mode'] == 'All' else row['mode']] if part)
+        parts.append(f"{where}: {row['value']}" if where else row['value'])
+    return f"{form}'s {label}: " + ', '.join(parts) + '.'
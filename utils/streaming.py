@@ -0,0 +1,44 @@
+import time
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from utils import metrics
+
+# Tag of the LLM that writes the answer; the question-condensing LLM is not tagged, so its
+# output (the rephrased question) never reaches the user
+ANSWER_TAG = "answer"
+
+class MessageStreamHandler(AsyncCallbackHandler):
+    """Streams the answer LLM's tokens into a Chainlit message as they are generated.
+
+    Records time to first token (from `start_time`, i.e. when the question arrived) and
+    the answer generation time.
+    """
+
+    def __init__(self, message, start_time=None, tag=ANSWER_TAG):
+        self.message = message
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.tag = tag
+        self.generation_start = None
+        self.first_token_seconds = None
+        self.generation_seconds = None
+        self.tokens = 0
+
+    async def on_llm_start(self, serialized, prompts, *, tags=None, **kwargs):
+        if self.tag in (tags or []):
+            self.generation_start = time.perf_counter()
+
+    async def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if self.tag not in (tags or []):
+            return
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.start_time
+            metrics.observe('time_to_first_token_seconds', self.first_token_seconds)
+        self.tokens += 1
+        await self.message.stream_token(token)
+
+    async def on_llm_end(self, response, *, tags=None, **kwargs):
+        if self.tag in (tags or []) and self.generation_start is not None:
+            self.generation_seconds = time.perf_counter() - self.generation_start
+            metrics.observe('answer_generation_seconds', self.generation_seconds)
+            metrics.incr('answer_tokens_streamed', self.tokens)
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from utils import metrics
+
+# A question less similar than this to the conversation's topic starts a new topic
+TOPIC_THRESHOLD = float(os.environ.get("TOPIC_THRESHOLD", "0.15"))
+# Weight of each new question in the rolling topic centroid
+TOPIC_CENTROID_WEIGHT = float(os.environ.get("TOPIC_CENTROID_WEIGHT", "0.3"))
+
+def _normalized(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class TopicTracker:
+    """Rolling topic of a conversation, as the moving average of its question embeddings.
+
+    Each question is embedded once, when it arrives, and compared with the centroid of the
+    earlier ones instead of with the previous answer, so a single off-topic sentence in an
+    answer doesn't decide the reset. The state is the centroid alone (float32 bytes).
+    """
+
+    def __init__(self, threshold=TOPIC_THRESHOLD, weight=TOPIC_CENTROID_WEIGHT, centroid=None):
+        self.threshold = threshold
+        self.weight = weight
+        self.centroid = centroid
+
+    def similarity(self, vector):
+        """Cosine similarity of a question embedding to the topic, None without a topic yet."""
+        if self.centroid is None:
+            return None
+        return float(_normalized(vector) @ self.centroid)
+
+    def update(self, vector):
+        """Add a question embedding, returns True when it starts a new topic."""
+        vector = _normalized(vector)
+        similarity = self.similarity(vector)
+        metrics.set_gauge('topic_threshold', self.threshold)
+        if similarity is None:
+            self.centroid = vector
+            return False
+        metrics.observe('topic_drift', 1.0 - similarity)
+        if similarity < self.threshold:
+            metrics.incr('topic_changes')
+            self.centroid = vector
+            return True
+        self.centroid = _normalized((1.0 - self.weight) * self.centroid + self.weight * vector)
+        return False
+
+    def to_bytes(self):
+        return None if self.centroid is None else self.centroid.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        centroid = np.frombuffer(data, dtype=np.float32).copy() if data else None
+        return cls(centroid=centroid, **kwargs)
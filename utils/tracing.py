@@ -0,0 +1,61 @@
+import contextvars
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from utils import metrics
+
+# Print one JSON line per answered message with its spans, e.g. for log shipping
+TRACE_JSON_LOGS = os.environ.get("TRACE_JSON_LOGS", "").lower() in ("1", "true", "yes")
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage: recorded as the `<name>_seconds` timing and, inside a request trace, as a span."""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe(f"{name}_seconds", duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            entry = {'name': name, 'start_ms': round((start - trace['start']) * 1000, 3),
+                     'duration_ms': round(duration * 1000, 3), **attributes}
+            if error:
+                entry['error'] = error
+            trace['spans'].append(entry)
+
+def annotate(**attributes):
+    """Add attributes (e.g. which path answered) to the current request trace."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace['attributes'].update(attributes)
+
+@contextmanager
+def request_trace(**attributes):
+    """Collect the spans of one request; logged as a JSON line at the end if TRACE_JSON_LOGS is set."""
+    trace = {'trace_id': uuid.uuid4().hex[:16], 'start': time.perf_counter(), 'attributes': dict(attributes), 'spans': []}
+    token = _current_trace.set(trace)
+    status = 'ok'
+    try:
+        yield trace
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _current_trace.reset(token)
+        total = time.perf_counter() - trace['start']
+        metrics.observe('request_seconds', total)
+        if TRACE_JSON_LOGS:
+            print(json.dumps({
+                'event': 'request', 'trace_id': trace['trace_id'], 'time': time.time(), 'status': status,
+                'duration_ms': round(total * 1000, 3), **trace['attributes'], 'spans': trace['spans'],
+            }, default=str), flush=True)
@@ -3,16 +3,23 @@ from bs4 import BeautifulSoup
 import json
 from utils.boss_stats_utils import *
 from utils.boss_desc import *
+from utils.http_fetch import fetch, fetch_stats, set_host_rate
 from fpdf import FPDF
 import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import unquote
 
-def fetch_wiki_page(url):
-    response = requests.get(url)
-    
-    if response.status_code != 200:
-        raise Exception(f"Error fetching page: {response.status_code}")
-    
-    return response.text
+# Structured section records written per boss, loaded directly by ingest.py
+SECTIONS_FILE = "sections.jsonl"
+# Typed stat rows (boss, form, stat, mode, value) for the no-LLM stats lookup
+STATS_FILE = "stats.jsonl"
+
+def fetch_wiki_page(url, offline=None):
+    # Pooled session + on-disk cache with conditional requests, see utils/http_fetch.py
+    return fetch(url, offline=offline)
 
 def extract_boss_name(url):
     # Use regex to find the last part of the URL after the last '/'
@@ -23,130 +30,237 @@ def extract_boss_name(url):
     return None
 
 
-def web_scraping(url_lst):
-    for url in url_lst:    
-        boss_name = extract_boss_name(url)
-        html_content = fetch_wiki_page(url)
-
-        # Loot
-        general_drop = extract_loot_items(html_content, '')
-        normal_drop = extract_loot_items(html_content, 'm-normal')
-        em_shareDrop = extract_loot_items(html_content, 'm-expert-master')
-        master_drop = extract_loot_items(html_content, 'm-master')
-
-        # Forms & Stats window
-        forms = extract_forms(html_content)
-        stat_of_forms = []
-        stat_data = {}
-        normal_loot = combine_loot([general_drop, normal_drop])
-        expert_loot = combine_loot([general_drop, em_shareDrop])
-        master_loot = combine_loot([general_drop, em_shareDrop, master_drop])
-        for form in forms.keys():
-            statContent = forms[form]
-            stat_data = get_stat(statContent, form)
-            # Check if stat_data is a dictionary
-            if isinstance(stat_data, dict):
-                stat_data['Sound'] = extract_audio(stat_data)
-                stat_of_forms.append(remove_square_brackets(format_boss_info(stat_data)))
-            else:
-                print(f"Warning: stat_data for {form} is not a dictionary: {stat_data}")
-        result_string = '\n\n\n'.join(stat_of_forms)
-
-        # Joining session
-        intro = extract_intro(html_content)
-        text = fetch_info(url)
-        lines = text.splitlines()
-        for i in range(len(lines)):
-            lines[i] = lines[i].strip()
-
-        # Find sessions
-        section_pattern = re.compile(r'^\d+\s+([A-Za-z\s]+)$')
-        subsection_pattern = re.compile(r'^\d+\.\d+\s+([A-Za-z\s]+)$')
-        Content_check = False
-        sessions = []
-        for line in lines:
-            section_match = section_pattern.match(line)
-            subsection_match = subsection_pattern.match(line)
-            
-            # If a section match is found, break the loop
-            if(line == 'Contents'):
-                Content_check = True
-                # print("The table of contents is incoming")
-
-            if section_match is not None:
-                # print("Section header found, breaking loop.")
-                sessions.append(line)
-            if subsection_match is not None:
-                # print("Section header found, breaking loop.")
-                sessions.append(line)  
-
-        for i in range(len(sessions)):
-            sessions[i] = sessions[i].split(' ')[-1]
-        sessions
-
-        session_dict = {}
-        key = 'Introduction'
-        session_dict[key] = ''
-        session_dict['Statistics'] = result_string
-        for i in range(len(lines)):
-            if lines[i] in sessions:
-                key = lines[i]
-                if key not in session_dict:
-                    session_dict[key] = ''
-            else:
-                session_dict[key] = (session_dict[key] + ' ' + lines[i]).strip()
-        session_dict['Introduction'] = intro
+def scrape_boss(url, offline=None, output_root="data", verbose=True, export_pdf=False):
+    """Scrape one boss page into section records (and optionally PDFs), returns the number of sections."""
+    boss_name = extract_boss_name(url)
+    html_content = fetch_wiki_page(url, offline=offline)
+
+    # Parse the page once, every extractor below works on this tree
+    soup = parse_html(html_content)
+
+    # Loot
+    general_drop = extract_loot_items(soup, '')
+    normal_drop = extract_loot_items(soup, 'm-normal')
+    em_shareDrop = extract_loot_items(soup, 'm-expert-master')
+    master_drop = extract_loot_items(soup, 'm-master')
+
+    # Forms & Stats window
+    forms = extract_form_tags(soup)
+    stat_of_forms = []
+    form_stats = []
+    stat_table = []
+    stat_data = {}
+    normal_loot = combine_loot([general_drop, normal_drop])
+    expert_loot = combine_loot([general_drop, em_shareDrop])
+    master_loot = combine_loot([general_drop, em_shareDrop, master_drop])
+    for form in forms.keys():
+        statContent = forms[form]
+        stat_data = get_stat(statContent, form)
+        # Check if stat_data is a dictionary
+        if isinstance(stat_data, dict):
+            stat_data['Sound'] = extract_audio(stat_data)
+            stat_of_forms.append(remove_square_brackets(format_boss_info(stat_data)))
+            form_stats.append((form, stat_of_forms[-1]))
+            stat_table.extend(stat_rows(unquote(boss_name).replace('_', ' '), stat_data))
+        else:
+            print(f"Warning: stat_data for {form} is not a dictionary: {stat_data}")
+    result_string = '\n\n\n'.join(stat_of_forms)
+
+    # Joining session
+    intro = extract_intro(soup)
+    text = extract_info(soup)
+    lines = text.splitlines()
+    for i in range(len(lines)):
+        lines[i] = lines[i].strip()
+
+    # Find sessions
+    section_pattern = re.compile(r'^\d+\s+([A-Za-z\s]+)$')
+    subsection_pattern = re.compile(r'^\d+\.\d+\s+([A-Za-z\s]+)$')
+    Content_check = False
+    sessions = []
+    for line in lines:
+        section_match = section_pattern.match(line)
+        subsection_match = subsection_pattern.match(line)
         
-        # Loot information
-        loot_lst = []
-        loot = {'Normal Drop': normal_loot, 'Expert Drop': expert_loot, 'Master Drop': master_loot}
-        if loot:
-            for mode, items in loot.items():
-                loot_lst.append(f"{mode}: {'; '.join(items) if items else 'No items'}\n")
+        # If a section match is found, break the loop
+        if(line == 'Contents'):
+            Content_check = True
+            # print("The table of contents is incoming")
+
+        if section_match is not None:
+            # print("Section header found, breaking loop.")
+            sessions.append(line)
+        if subsection_match is not None:
+            # print("Section header found, breaking loop.")
+            sessions.append(line)  
+
+    for i in range(len(sessions)):
+        sessions[i] = sessions[i].split(' ')[-1]
+    sessions
+
+    session_dict = {}
+    key = 'Introduction'
+    session_dict[key] = ''
+    session_dict['Statistics'] = result_string
+    for i in range(len(lines)):
+        if lines[i] in sessions:
+            key = lines[i]
+            if key not in session_dict:
+                session_dict[key] = ''
         else:
-            loot_lst.append("Loot: N/A")
+            session_dict[key] = (session_dict[key] + ' ' + lines[i]).strip()
+    session_dict['Introduction'] = intro
+    
+    # Loot information
+    loot_lst = []
+    loot = {'Normal Drop': normal_loot, 'Expert Drop': expert_loot, 'Master Drop': master_loot}
+    if loot:
+        for mode, items in loot.items():
+            loot_lst.append(f"{mode}: {'; '.join(items) if items else 'No items'}\n")
+    else:
+        loot_lst.append("Loot: N/A")
 
-        session_dict['Loot'] = '\n'.join(loot_lst)
-        del session_dict['Arms']
-        del session_dict['Trivia']
-        del session_dict['References']
+    session_dict['Loot'] = '\n'.join(loot_lst)
+    for key in ['Arms', 'Trivia', 'References']:
+        session_dict.pop(key, None)
 
-        # Convert the dictionary to a string format
-        dict_string = '\n'.join([f"{key}: {value}" for key, value in session_dict.items()])
+    output_folder = os.path.join(output_root, boss_name)
+    os.makedirs(output_folder, exist_ok=True)
 
-        for key, value in session_dict.items():
-            # Convert the session's data into a string
-            dict_string = f"{key}: {value}"
+    records = build_section_records(session_dict, form_stats, boss_name, url)
+    sections_path = write_section_records(records, output_folder)
+    write_section_records(stat_table, output_folder, STATS_FILE)
+    if verbose:
+        print(f"{len(records)} section records saved at {sections_path}")
 
-            # Define inputs
-            output_folder = f"data/{boss_name}"
+    if export_pdf:
+        export_sections_pdf(session_dict, output_folder, verbose)
 
-            # Ensure the output folder exists
-            os.makedirs(output_folder, exist_ok=True)
+    return len(session_dict)
 
-            # Define the PDF file path
-            pdf_file_path = os.path.join(output_folder, f"{key}.pdf")
+def build_section_records(session_dict, form_stats, boss_name, url):
+    """One record per section, the Statistics section gets one record per form."""
+    scraped_at = datetime.now(timezone.utc).isoformat()
+    records = []
+    for key, value in session_dict.items():
+        if key == 'Statistics' and form_stats:
+            parts = form_stats
+        else:
+            parts = [(None, value)]
+        for form, text in parts:
+            records.append({
+                'boss': unquote(boss_name).replace('_', ' '),
+                'section': key,
+                'form': form,
+                'text': text,
+                'source': url,
+                'scraped_at': scraped_at,
+            })
+    return records
+
+def write_section_records(records, output_folder, file_name=SECTIONS_FILE):
+    """Write the records as JSON lines, replacing the previous file in one step."""
+    sections_path = os.path.join(output_folder, file_name)
+    tmp_path = f"{sections_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, sections_path)
+    return sections_path
+
+def export_sections_pdf(session_dict, output_folder, verbose=True):
+    """Optional PDF export, one file per section (characters outside Latin-1 are replaced)."""
+    for key, value in session_dict.items():
+        # Convert the session's data into a string
+        dict_string = f"{key}: {value}"
+
+        # Define the PDF file path
+        pdf_file_path = os.path.join(output_folder, f"{key}.pdf")
 
-            # Function to replace unsupported characters for PDF generation
-            def replace_unsupported_characters(text):
-                # List of supported characters for the Helvetica font
-                supported_characters = re.compile(r'[\x00-\x7F\xA0-\xFF]+')
-                return ''.join([char if supported_characters.match(char) else ' ' for char in text])
+        # Function to replace unsupported characters for PDF generation
+        def replace_unsupported_characters(text):
+            # List of supported characters for the Helvetica font
+            supported_characters = re.compile(r'[\x00-\x7F\xA0-\xFF]+')
+            return ''.join([char if supported_characters.match(char) else ' ' for char in text])
 
-            # Clean the content
-            cleaned_content = replace_unsupported_characters(dict_string)
+        # Clean the content
+        cleaned_content = replace_unsupported_characters(dict_string)
 
-            # Initialize the PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('Arial', size=12)
+        # Initialize the PDF
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font('Arial', size=12)
 
-            # Write cleaned content to the PDF
-            pdf.multi_cell(0, 10, cleaned_content)
+        # Write cleaned content to the PDF
+        pdf.multi_cell(0, 10, cleaned_content)
 
-            # Save the PDF
-            pdf.output(pdf_file_path)
+        # Save the PDF
+        pdf.output(pdf_file_path)
+        if verbose:
             print(f"PDF saved at {pdf_file_path}")
+
+def web_scraping(url_lst, offline=None, workers=1, output_root="data", export_pdf=False):
+    """Scrape every boss page in url_lst, concurrently when workers > 1.
+
+    A page that fails is reported and skipped, it never aborts the rest of the batch.
+    """
+    start = time.perf_counter()
+    results = {}
+
+    def run(url):
+        t0 = time.perf_counter()
+        try:
+            sections = scrape_boss(url, offline=offline, output_root=output_root, verbose=workers == 1, export_pdf=export_pdf)
+            return url, sections, None, time.perf_counter() - t0
+        except Exception as e:
+            return url, 0, e, time.perf_counter() - t0
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run, url) for url in url_lst]
+            outcomes = (future.result() for future in as_completed(futures))
+            for done, outcome in enumerate(outcomes, 1):
+                results[outcome[0]] = outcome
+                _report_progress(done, len(url_lst), outcome)
+    else:
+        for done, url in enumerate(url_lst, 1):
+            outcome = run(url)
+            results[url] = outcome
+            _report_progress(done, len(url_lst), outcome)
+
+    elapsed = time.perf_counter() - start
+    failed = {url: str(error) for url, _, error, _ in results.values() if error is not None}
+    summary = {
+        'pages': len(url_lst),
+        'succeeded': len(url_lst) - len(failed),
+        'failed': failed,
+        'sections': sum(sections for _, sections, _, _ in results.values()),
+        'elapsed_s': round(elapsed, 3),
+        'pages_per_s': round(len(url_lst) / elapsed, 2) if elapsed > 0 else None,
+        'fetch': dict(fetch_stats),
+    }
+    print(f"Scraped {summary['succeeded']}/{summary['pages']} pages in {summary['elapsed_s']}s "
+          f"({summary['pages_per_s']} pages/s), fetch: {summary['fetch']}")
+    for url, error in failed.items():
+        print(f"  FAILED {url}: {error}")
+    return summary
+
+def _report_progress(done, total, outcome):
+    url, sections, error, seconds = outcome
+    status = f"failed ({error})" if error is not None else f"ok, {sections} sections"
+    print(f"[{done}/{total}] {extract_boss_name(url)}: {status} in {seconds:.2f}s")
+
 if __name__ == "__main__":
-    url_lst = ['https://terraria.wiki.gg/wiki/Skeletron_Prime']
-    web_scraping(url_lst)
+    parser = argparse.ArgumentParser(description="Scrape Terraria wiki boss pages.")
+    parser.add_argument('urls', nargs='*', help="Boss page URLs (defaults to Skeletron Prime)")
+    parser.add_argument('--offline', action='store_true', help="Replay pages from the response cache without network access")
+    parser.add_argument('--workers', type=int, default=1, help="Number of pages scraped concurrently")
+    parser.add_argument('--rate', type=float, default=None, help="Maximum requests per second per host (0 disables the limit)")
+    parser.add_argument('--pdf', action='store_true', help="Also export every section as a PDF")
+    args = parser.parse_args()
+
+    if args.rate is not None:
+        set_host_rate(args.rate)
+
+    url_lst = args.urls or ['https://terraria.wiki.gg/wiki/Skeletron_Prime']
+    web_scraping(url_lst, offline=args.offline or None, workers=args.workers, export_pdf=args.pdf)